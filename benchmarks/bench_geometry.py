@@ -0,0 +1,140 @@
+""" Microbenchmarks of the per frame geometry and blendshape calculation.
+
+Runs without a camera or window on synthetic landmarks (the canonical face
+model with random rotation, translation, scale and noise), so it can be used
+on a headless machine to catch performance regressions in the hot path.
+Before the timing, the results of GeometryWorkspace are checked against
+get_metric_landmarks, so an optimization that changes the results fails:
+
+    python -m benchmarks.bench_geometry --iterations 2000 --json geometry.json
+"""
+
+import json
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import numpy as np
+from pylivelinkface import PyLiveLinkFace
+
+from mefamo.custom.face_geometry import (
+    PCF,
+    GeometryWorkspace,
+    canonical_metric_landmarks,
+    get_metric_landmarks,
+    landmark_weights,
+    solve_weighted_orthogonal_problem,
+)
+from mefamo.blendshapes.blendshape_calculator import BlendshapeCalculator
+from mefamo.mefamo import calculate_rotation
+from mefamo.utils.synthetic import random_landmarks, to_landmark_list
+
+IMAGE_SHAPE = (480, 640, 3)
+
+
+def measure(name, function, fixtures, iterations):
+    """ Calls the function with all fixtures (round robin) and returns the timing and allocation stats. """
+    # warm up caches and lazy initializations
+    for fixture in fixtures[:10]:
+        function(fixture)
+
+    durations = np.empty(iterations)
+    for i in range(iterations):
+        fixture = fixtures[i % len(fixtures)]
+        start = time.perf_counter()
+        function(fixture)
+        durations[i] = time.perf_counter() - start
+
+    # allocations are measured separately, tracemalloc slows down every call
+    allocation_iterations = min(iterations, 200)
+    tracemalloc.start()
+    base, _ = tracemalloc.get_traced_memory()
+    peak = 0
+    for i in range(allocation_iterations):
+        tracemalloc.reset_peak()
+        function(fixtures[i % len(fixtures)])
+        peak = max(peak, tracemalloc.get_traced_memory()[1] - base)
+    retained = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+
+    return {
+        'name': name,
+        'iterations': iterations,
+        'ops_per_sec': iterations / durations.sum(),
+        'mean_us': durations.mean() * 1e6,
+        'p50_us': np.percentile(durations, 50) * 1e6,
+        'p99_us': np.percentile(durations, 99) * 1e6,
+        'peak_alloc_kib': peak / 1024,
+        'retained_kib_per_call': retained / allocation_iterations / 1024,
+    }
+
+
+def check_workspace(workspace, pcf, screen_landmarks, tolerance=1e-9):
+    """ Raises an AssertionError if the workspace doesn't give the results of get_metric_landmarks, returns the largest difference. """
+    difference = 0.0
+    for lm in screen_landmarks:
+        expected_landmarks, expected_pose = get_metric_landmarks(lm.copy(), pcf)
+        # both layouts of the input, 3 x N and N x 3
+        for screen in (lm.copy(), np.ascontiguousarray(lm.T)):
+            original = screen.copy()
+            metric_landmarks, pose_transform_mat = workspace.get_metric_landmarks(screen)
+            assert np.array_equal(screen, original), 'GeometryWorkspace changed its input'
+            difference = max(difference, np.abs(metric_landmarks - expected_landmarks).max(),
+                             np.abs(pose_transform_mat - expected_pose).max())
+    assert difference <= tolerance, f'GeometryWorkspace differs from get_metric_landmarks by {difference:.3g}'
+    return difference
+
+
+def run(iterations=1000, num_fixtures=64, seed=0, noise=0.001):
+    rng = np.random.default_rng(seed)
+    pcf = PCF(frame_height=IMAGE_SHAPE[0], frame_width=IMAGE_SHAPE[1], fy=IMAGE_SHAPE[1])
+    landmarks = [random_landmarks(rng, pcf, noise=noise) for _ in range(num_fixtures)]
+    landmark_lists = [to_landmark_list(lm) for lm in landmarks]
+    screen_landmarks = [np.ascontiguousarray(lm[:468].T) for lm in landmarks]
+    metric_landmarks = [get_metric_landmarks(lm.copy(), pcf)[0] for lm in screen_landmarks]
+
+    workspace = GeometryWorkspace(pcf)
+    difference = check_workspace(workspace, pcf, screen_landmarks)
+    print(f'GeometryWorkspace matches get_metric_landmarks (largest difference {difference:.3g})')
+
+    live_link_face = PyLiveLinkFace(fps=30, filter_size=4)
+    calculator = BlendshapeCalculator()
+
+    benchmarks = [
+        ('get_metric_landmarks', lambda lm: get_metric_landmarks(lm.copy(), pcf), screen_landmarks),
+        ('workspace.get_metric_landmarks', workspace.get_metric_landmarks, screen_landmarks),
+        ('solve_weighted_orthogonal_problem',
+         lambda lm: solve_weighted_orthogonal_problem(canonical_metric_landmarks, lm, landmark_weights), metric_landmarks),
+        ('calculate_rotation', lambda lm: calculate_rotation(lm, pcf, IMAGE_SHAPE), landmark_lists),
+        ('calculate_rotation (workspace)',
+         lambda lm: calculate_rotation(lm, pcf, IMAGE_SHAPE, workspace=workspace), landmark_lists),
+        ('calculate_blendshapes',
+         lambda lm: calculator.calculate_blendshapes(live_link_face, lm.T, None), metric_landmarks),
+    ]
+    return [measure(name, function, fixtures, iterations) for name, function, fixtures in benchmarks]
+
+
+def print_results(results):
+    print(f'{"benchmark":<36}{"ops/sec":>10}{"mean us":>10}{"p50 us":>10}{"p99 us":>10}{"peak KiB":>10}{"kept KiB":>10}')
+    for r in results:
+        print(f'{r["name"]:<36}{r["ops_per_sec"]:>10.0f}{r["mean_us"]:>10.1f}{r["p50_us"]:>10.1f}'
+              f'{r["p99_us"]:>10.1f}{r["peak_alloc_kib"]:>10.1f}{r["retained_kib_per_call"]:>10.2f}')
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--iterations', type=int, default=1000,
+                        help='Number of calls per benchmark.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed for the synthetic landmarks.')
+    parser.add_argument('--noise', type=float, default=0.001,
+                        help='Noise added to the normalized synthetic landmarks.')
+    parser.add_argument('--json', default=None,
+                        help='Write the results to this json file.')
+    args = parser.parse_args()
+
+    results = run(args.iterations, seed=args.seed, noise=args.noise)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,98 @@
+""" Import time report of the MeFaMo modules and the startup of the CLI.
+
+Every module is imported in a fresh interpreter with `-X importtime`, which
+reports the time of every (nested) import. The report lists the total import
+time and the slowest imports, so heavy dependencies that sneak into the
+startup (like open3d) show up:
+
+    python -m benchmarks.bench_import --top 15 --json imports.json
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+from argparse import ArgumentParser
+
+MODULES = [
+    'mefamo',
+    'mefamo.mefamo',
+    'mefamo.utils.drawing',
+    'mefamo.parallel.multi_camera',
+    'mefamo.takes.replay',
+]
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """ Parses the `-X importtime` output into a list of (module, self_us, cumulative_us, depth). """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        imports.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return imports
+
+
+def measure_import(code, repeat):
+    """ Runs the code in fresh interpreters and returns the best wall time and the import times of the fastest run. """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                                capture_output=True, text=True)
+        wall = time.perf_counter() - start
+        if result.returncode != 0:
+            return {'error': result.stderr.strip().splitlines()[-1]}
+        if best is None or wall < best['wall_ms'] / 1000:
+            imports = parse_importtime(result.stderr)
+            best = {
+                'wall_ms': wall * 1000,
+                # the top level imports add up to the total import time
+                'import_ms': sum(cumulative for _, _, cumulative, depth in imports if depth == 0) / 1000,
+                'imports': imports,
+            }
+    return best
+
+
+def print_result(name, result, top):
+    if 'error' in result:
+        print(f'{name:<32} failed: {result["error"]}')
+        return
+    print(f'{name:<32} {result["import_ms"]:>8.1f} ms imports {result["wall_ms"]:>8.1f} ms wall')
+    slowest = sorted(result['imports'], key=lambda entry: entry[2], reverse=True)
+    # only the top level packages, their submodules are part of their cumulative time
+    packages = [entry for entry in slowest if '.' not in entry[0]][:top]
+    for module, self_us, cumulative_us, depth in packages:
+        print(f'{"":>4}{module:<28} {cumulative_us / 1000:>8.1f} ms')
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--modules', nargs='+', default=MODULES,
+                        help='Modules to import.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of runs per module, the fastest one is reported.')
+    parser.add_argument('--top', type=int, default=10,
+                        help='Number of the slowest packages to list per module.')
+    parser.add_argument('--json', default=None,
+                        help='Write the results to this json file.')
+    args = parser.parse_args()
+
+    results = {}
+    for module in args.modules:
+        results[module] = measure_import(f'import {module}', args.repeat)
+        print_result(module, results[module], args.top)
+
+    # what examples/mefamo_cli.py imports before it starts the face tracking
+    code = 'from mefamo import Mefamo'
+    results[code] = measure_import(code, args.repeat)
+    print_result(code, results[code], args.top)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
@@ -0,0 +1,190 @@
+""" End-to-end throughput benchmark of the whole Mefamo pipeline.
+
+Renders a synthetic face video (the canonical face model with scripted
+expressions and head movements) into a local file and runs the full pipeline
+on it, without windows and with a local LiveLink receiver instead of Unreal.
+It reports the sustained frames per second, the CPU time per frame, the latency
+of the pipeline stages and the capture-to-packet latency for several input
+resolutions and FaceMesh settings:
+
+    python -m benchmarks.bench_pipeline --frames 300 --json pipeline.json
+
+With --allocations every setting runs a second time with tracemalloc, which
+reports how much memory a frame allocates (capture and processing, on top of
+what was allocated before the frame), so buffers that get allocated for every
+frame show up. The mediapipe graph allocates outside of Python and isn't part
+of it.
+"""
+
+import json
+import math
+import os
+import tempfile
+import time
+import tracemalloc
+from argparse import ArgumentParser
+
+import cv2
+import numpy as np
+
+from mefamo import Mefamo
+from mefamo.network.receiver import LiveLinkReceiver
+from mefamo.utils.synthetic import FaceRenderer
+
+RESOLUTIONS = [(640, 480), (1280, 720), (1920, 1080)]
+FACE_MESH_SETTINGS = [
+    {'refine_landmarks': True, 'static_image_mode': False},
+    {'refine_landmarks': False, 'static_image_mode': False},
+    {'refine_landmarks': True, 'static_image_mode': True},
+]
+
+
+def render_video(path, width, height, frames, fps=30):
+    """ Renders the synthetic face video with scripted expressions and head movements. """
+    renderer = FaceRenderer(width, height)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f'Could not open {path} for writing')
+    for i in range(frames):
+        t = i / fps
+        points = renderer.expression(
+            jaw_open=0.5 + 0.5 * math.sin(2 * math.pi * 0.5 * t),
+            # blink every two seconds
+            blink=max(0.0, math.cos(math.pi * t) ** 40),
+            smile=0.5 + 0.5 * math.sin(2 * math.pi * 0.2 * t))
+        landmarks = renderer.landmarks(
+            points,
+            pitch=0.2 * math.sin(2 * math.pi * 0.3 * t),
+            yaw=0.4 * math.sin(2 * math.pi * 0.25 * t),
+            roll=0.15 * math.sin(2 * math.pi * 0.4 * t))
+        writer.write(renderer.render(landmarks))
+    writer.release()
+
+
+def run_pipeline(video, settings):
+    receiver = LiveLinkReceiver(port=0)
+    receiver.start()
+
+    # the clocks start when the warm up is done and the video is open, so only the frame loop is measured
+    start = {}
+    def on_ready(mefamo):
+        start['wall'] = time.perf_counter()
+        start['cpu'] = time.process_time()
+        start['receiver_cpu'] = receiver.cpu_time
+
+    mefamo = Mefamo(input=video, port=receiver.port, hide_image=True, profile=True, latency_probe=True,
+                    face_mesh_settings=settings, on_ready=on_ready)
+
+    try:
+        mefamo.start()
+        wall = time.perf_counter() - start['wall']
+        cpu = time.process_time() - start['cpu']
+        # the receiver runs in this process as well, its CPU time is reported on its own
+        receiver_cpu = receiver.cpu_time - start['receiver_cpu']
+        cpu -= receiver_cpu
+        # give the network thread the time to send the last packet
+        time.sleep(0.1)
+    finally:
+        # the next runs shouldn't share the CPU with the threads of this one
+        mefamo.close()
+        receiver.stop()
+    report = receiver.report()
+
+    frames = mefamo.timer.frame
+    if frames == 0:
+        raise RuntimeError(f'No frames of {video} were processed')
+    stages = mefamo.timer.percentiles()
+    return {
+        'frames': frames,
+        'fps': frames / wall,
+        'cpu_ms_per_frame': cpu / frames * 1000,
+        'receiver_cpu_ms_per_frame': receiver_cpu / frames * 1000,
+        'packets': report['packets'],
+        'latency_ms': report.get('latency_ms'),
+        'stages': stages,
+    }
+
+
+def measure_allocations(video, settings):
+    """ Runs the pipeline with tracemalloc, returns the percentiles of the memory allocated per frame in KiB. """
+    receiver = LiveLinkReceiver(port=0)
+    receiver.start()
+    mefamo = Mefamo(input=video, port=receiver.port, hide_image=True, face_mesh_settings=settings,
+                    on_ready=lambda mefamo: tracemalloc.start())
+
+    # the peak between the starts of two frames, above the memory at the start of the first one
+    allocated = []
+    base = [None]
+    process_image = mefamo._process_image
+    def traced_process_image(*args, **kwargs):
+        current, peak = tracemalloc.get_traced_memory()
+        if base[0] is not None:
+            allocated.append(peak - base[0])
+        tracemalloc.reset_peak()
+        base[0] = current
+        return process_image(*args, **kwargs)
+    mefamo._process_image = traced_process_image
+
+    try:
+        mefamo.start()
+    finally:
+        tracemalloc.stop()
+        mefamo.close()
+        receiver.stop()
+
+    if not allocated:
+        raise RuntimeError(f'No frames of {video} were processed')
+    allocated = np.array(allocated) / 1024
+    return {f'p{p}': float(np.percentile(allocated, p)) for p in (50, 90, 99)}
+
+
+def print_result(result):
+    print(f'{result["resolution"]:>10} {result["settings"]:<48} {result["fps"]:>7.1f} fps '
+          f'{result["cpu_ms_per_frame"]:>7.1f} ms cpu/frame {result["packets"]:>5} packets '
+          f'({result["receiver_cpu_ms_per_frame"]:.2f} ms cpu/frame of the receiver not included)')
+    if result['latency_ms']:
+        latency = result['latency_ms']
+        print(f'{"":>12}{"capture-to-packet":<18}{latency["p50"]:>8.2f} {latency["p90"]:>8.2f} {latency["p99"]:>8.2f} ms')
+    if result.get('allocated_kib'):
+        allocated = result['allocated_kib']
+        print(f'{"":>12}{"allocated KiB":<18}{allocated["p50"]:>8.0f} {allocated["p90"]:>8.0f} {allocated["p99"]:>8.0f} per frame')
+    for name, stats in result['stages'].items():
+        print(f'{"":>12}{name:<18}{stats["p50"]:>8.2f} {stats["p90"]:>8.2f} {stats["p99"]:>8.2f} ms')
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--frames', type=int, default=300,
+                        help='Number of frames of the synthetic video.')
+    parser.add_argument('--resolutions', nargs='+', default=[f'{w}x{h}' for w, h in RESOLUTIONS],
+                        help='Input resolutions to benchmark, e.g. 640x480 1280x720.')
+    parser.add_argument('--video_dir', default=None,
+                        help='Folder for the rendered videos, a temporary folder is used if not set.')
+    parser.add_argument('--allocations', action='store_true',
+                        help='Also measure the memory allocated per frame with tracemalloc (in a separate run).')
+    parser.add_argument('--json', default=None,
+                        help='Write the results to this json file.')
+    args = parser.parse_args()
+
+    video_dir = args.video_dir or tempfile.mkdtemp(prefix='mefamo_bench_')
+    os.makedirs(video_dir, exist_ok=True)
+    results = []
+    for resolution in args.resolutions:
+        width, height = (int(v) for v in resolution.split('x'))
+        video = os.path.join(video_dir, f'synthetic_{width}x{height}_{args.frames}.mp4')
+        if not os.path.exists(video):
+            print(f'Rendering {video}')
+            render_video(video, width, height, args.frames)
+
+        for settings in FACE_MESH_SETTINGS:
+            result = run_pipeline(video, settings)
+            result['resolution'] = resolution
+            result['settings'] = ', '.join(f'{k}={v}' for k, v in settings.items())
+            if args.allocations:
+                result['allocated_kib'] = measure_allocations(video, settings)
+            print_result(result)
+            results.append(result)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=4)
@@ -1,10 +1,11 @@
-from mefamo import Mefamo
 from argparse import ArgumentParser
+import sys
 
 if __name__ == "__main__":
     parser = ArgumentParser()
-    parser.add_argument('--input', default='0',
-                        help='Video source. Can be an integer for webcam or a string for a video file.')
+    parser.add_argument('--input', nargs='+', default=['0'],
+                        help='Video source. Can be an integer for webcam or a string for a video file. '
+                             'With several sources, every source runs in its own worker process.')
     parser.add_argument('--ip', default='127.0.0.1',
                         help='IP address of the Unreal LiveLink server.')
     parser.add_argument('--port', default=11111,
@@ -15,8 +16,110 @@ if __name__ == "__main__":
                         help='Hide the image window.')
     parser.add_argument('--show_debug', action='store_true',
                         help='Show debug window.')
+    parser.add_argument('--output_fps', type=int, default=None,
+                        help='Send the LiveLink packets with this rate, interpolating between the captured frames.')
+    parser.add_argument('--predict', choices=['velocity', 'kalman'], default=None,
+                        help='Extrapolate the blendshapes and head pose forward to compensate the pipeline latency.')
+    parser.add_argument('--predict_extra_latency', type=float, default=0.0,
+                        help='Latency in ms that gets added to the measured one for the prediction (network, Unreal).')
+    parser.add_argument('--filter', choices=['moving_average', 'one_euro'], default='moving_average',
+                        help='Filter used to smooth the blendshapes and head rotation.')
+    parser.add_argument('--profile', action='store_true',
+                        help='Measure the time of every stage of the pipeline and show it in the debug window.')
+    parser.add_argument('--profile_json', default=None,
+                        help='Write the measured stage timings (p50/p90/p99 in ms) to this json file on exit.')
+    parser.add_argument('--trace', default=None,
+                        help='Write every stage of every frame as Chrome trace events to this json file (open it in ui.perfetto.dev).')
+    parser.add_argument('--latency_probe', action='store_true',
+                        help='Append the frame id and capture time to every packet, to measure the latency with mefamo_receiver.py.')
+    parser.add_argument('--record', default=None,
+                        help='Record the landmarks, head pose and blendshapes of every frame into this take file.')
+    parser.add_argument('--replay', default=None,
+                        help='Send a recorded take file to LiveLink instead of running the face tracking.')
+    parser.add_argument('--replay_fast', action='store_true',
+                        help='Replay the take as fast as possible instead of with its original timing.')
+    parser.add_argument('--replay_loop', action='store_true',
+                        help='Replay the take in a loop.')
+    parser.add_argument('--landmark_cache', default=None,
+                        help='Folder to cache the landmarks of video files, later runs on the same video skip the face mesh inference.')
+    parser.add_argument('--num_faces', type=int, default=1,
+                        help='Number of faces to track, every face is sent as its own LiveLink subject.')
+    parser.add_argument('--warmup_frames', type=int, default=10,
+                        help='Number of synthetic frames that warm up the face mesh before the capture starts (0 disables the warm up).')
+    parser.add_argument('--motion_threshold', type=float, default=None,
+                        help='Skip the face mesh on frames where no part of the face region changed by more than this gray value (0 - 255), e.g. 4.')
+    parser.add_argument('--inference_width', type=int, default=None,
+                        help='Scale the frames down to this width for the face mesh (e.g. 640 for a 1080p camera), the image is still shown in full size.')
+    parser.add_argument('--frame_budget', type=float, default=None,
+                        help='Processing time per frame in ms (e.g. 33), the quality gets lowered step by step while the frames take longer.')
+    parser.add_argument('--idle_after', type=int, default=None,
+                        help='Number of frames without a face, after which only --idle_fps frames per second get processed until a face is found.')
+    parser.add_argument('--idle_fps', type=float, default=2.0,
+                        help='Frames per second that get processed (and sent) while idle.')
+    parser.add_argument('--idle_pose', choices=['hold', 'neutral'], default='hold',
+                        help='Keep the last pose while idle or send a neutral one.')
+    parser.add_argument('--paced', action='store_true',
+                        help='Play video files with their frame rate, frames are skipped while the processing is behind.')
+    parser.add_argument('--no_frame_drop', action='store_true',
+                        help="Process every queued camera frame, instead of skipping to the newest one while the processing is behind.")
+    parser.add_argument('--parallel', action='store_true',
+                        help='Run the capture, face mesh, display and blend shapes in separate processes.')
     args = parser.parse_args()
 
+    if args.replay:
+        # doesn't need mediapipe or a camera
+        from mefamo.takes.replay import replay_take
+        print(f"Replaying {args.replay}")
+        frames = replay_take(args.replay, args.ip, int(args.port), realtime=not args.replay_fast, loop=args.replay_loop)
+        print(f"Sent {frames} frames")
+        sys.exit(0)
+
+    if len(args.input) > 1 or args.parallel:
+        unsupported = [name for name in ('show_3d', 'show_debug', 'output_fps', 'profile', 'profile_json', 'trace', 'record', 'landmark_cache',
+                                              'motion_threshold', 'inference_width', 'frame_budget',
+                                              'idle_after', 'paced', 'no_frame_drop')
+                       if getattr(args, name)]
+        if unsupported:
+            parser.error(f"{', '.join('--' + name for name in unsupported)} can't be used with several inputs or --parallel.")
+
+        options = dict(num_faces=args.num_faces,
+                       filter=args.filter,
+                       predict=args.predict,
+                       predict_extra_latency=args.predict_extra_latency / 1000.0,
+                       latency_probe=args.latency_probe)
+        if len(args.input) > 1:
+            from mefamo.parallel.multi_camera import MultiCameraMefamo
+            print(f"Starting MeFaMo with {len(args.input)} inputs")
+            MultiCameraMefamo(args.input, args.ip, int(args.port), **options).start()
+        else:
+            from mefamo.parallel.pipeline import PipelineMefamo
+            print("Starting the parallel MeFaMo pipeline")
+            PipelineMefamo(args.input[0], args.ip, int(args.port), hide_image=args.hide_image, **options).start()
+        sys.exit(0)
+
+    # imported here, so replaying doesn't load mediapipe
+    from mefamo import Mefamo
+
     print("Starting MeFaMo")
-    mediapipe_face = Mefamo(args.input, args.ip, args.port, args.show_3d, args.hide_image, args.show_debug)
+    mediapipe_face = Mefamo(args.input[0], args.ip, args.port, args.show_3d, args.hide_image, args.show_debug,
+                            output_fps=args.output_fps,
+                            predict=args.predict,
+                            predict_extra_latency=args.predict_extra_latency / 1000.0,
+                            filter=args.filter,
+                            profile=args.profile,
+                            profile_json=args.profile_json,
+                            trace=args.trace,
+                            latency_probe=args.latency_probe,
+                            record=args.record,
+                            landmark_cache=args.landmark_cache,
+                            num_faces=args.num_faces,
+                            warmup_frames=args.warmup_frames,
+                            motion_threshold=args.motion_threshold,
+                            inference_width=args.inference_width,
+                            frame_budget=args.frame_budget / 1000.0 if args.frame_budget else None,
+                            idle_after=args.idle_after,
+                            idle_fps=args.idle_fps,
+                            idle_pose=args.idle_pose,
+                            paced=args.paced,
+                            drop_frames=not args.no_frame_drop)
     mediapipe_face.start()
\ No newline at end of file
@@ -41,6 +41,10 @@ class MediapipeFaceGUI(App):
         mdpf_thread = threading.Thread(target=self.mdpf.start, daemon=True)
         mdpf_thread.start()
 
+        # the texture gets reused for every frame, only new frames (by their sequence number) are uploaded
+        self.texture = None
+        self.frame_seq = 0
+
         Clock.schedule_interval(self.update, 1.0/60.0)
         return layout
 
@@ -51,14 +55,22 @@ class MediapipeFaceGUI(App):
         print('The button %s state is <%s>' % (instance, instance.state))
 
     def update(self, dt):
-        if self.mdpf.image is not None:
-            buf1 = cv2.flip(self.mdpf.image, 0)
-            buf = buf1.tostring()
-            texture1 = Texture.create(size=(self.mdpf.image.shape[1], self.mdpf.image.shape[0]), colorfmt='bgr') 
+        frame = self.mdpf.image_frames.read(self.frame_seq)
+        if frame is None:
+            return
+        self.frame_seq, image, _ = frame
+
+        height, width = image.shape[:2]
+        if self.texture is None or self.texture.size != (width, height):
             #if working on RASPBERRY PI, use colorfmt='rgba' here instead, but stick with "bgr" in blit_buffer. 
-            texture1.blit_buffer(buf, colorfmt='bgr', bufferfmt='ubyte')
+            self.texture = Texture.create(size=(width, height), colorfmt='bgr') 
+            # the rows of opencv images start at the top, the ones of textures at the bottom
+            self.texture.flip_vertical()
             # display image from the texture
-            self.img1.texture = texture1
+            self.img1.texture = self.texture
+        # the frames of the slot are contiguous, so the flat view shares their memory instead of copying like tobytes()
+        self.texture.blit_buffer(image.reshape(-1), colorfmt='bgr', bufferfmt='ubyte')
+        self.img1.canvas.ask_update()
                 
         
         # display image from cam in opencv window
@@ -0,0 +1,33 @@
+from mefamo.network.receiver import LiveLinkReceiver
+from argparse import ArgumentParser
+import json
+import time
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument('--ip', default='127.0.0.1',
+                        help='IP address to listen on.')
+    parser.add_argument('--port', type=int, default=11111,
+                        help='Port to listen on (the port MeFaMo sends to).')
+    parser.add_argument('--duration', type=float, default=None,
+                        help='Stop after this many seconds, otherwise stop with Ctrl+C.')
+    parser.add_argument('--json', default=None,
+                        help='Write the latency report to this json file.')
+    args = parser.parse_args()
+
+    print(f"Receiving LiveLink packets on {args.ip}:{args.port}, start MeFaMo with --latency_probe")
+    receiver = LiveLinkReceiver(args.ip, args.port)
+    receiver.start()
+    try:
+        start = time.monotonic()
+        while args.duration is None or time.monotonic() - start < args.duration:
+            time.sleep(0.1)
+    except KeyboardInterrupt:
+        pass
+    receiver.stop()
+
+    report = receiver.report()
+    print(LiveLinkReceiver.format_report(report))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=4)
@@ -1 +1,7 @@
-from .mefamo import Mefamo
+def __getattr__(name):
+    # Mefamo imports OpenCV and the face geometry (mediapipe only when a Mefamo is created), so they're only
+    # loaded when it's used, e.g. not when replaying a take
+    if name == 'Mefamo':
+        from .mefamo import Mefamo
+        return Mefamo
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
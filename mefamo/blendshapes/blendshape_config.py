@@ -107,4 +107,18 @@ class BlendShapeConfig:
             # FaceBlendShape.RightEyeRoll : (-0.4, 0.0), 
         }
 
+        # one euro filter settings (min cutoff in Hz, beta), used for all blend shapes not listed in filter_config
+        filter_default = (1.0, 0.5)
+        filter_config = {
+            # blinking is fast, so it needs a fast response
+            FaceBlendShape.EyeBlinkLeft : (8.0, 5.0),
+            FaceBlendShape.EyeBlinkRight : (8.0, 5.0),
+            FaceBlendShape.EyeWideLeft : (4.0, 2.0),
+            FaceBlendShape.EyeWideRight : (4.0, 2.0),
+            FaceBlendShape.JawOpen : (2.0, 1.0),
+            FaceBlendShape.HeadYaw : (1.0, 2.0),
+            FaceBlendShape.HeadPitch : (1.0, 2.0),
+            FaceBlendShape.HeadRoll : (1.0, 2.0),
+        }
+
        
@@ -2676,4 +2676,119 @@ def combine_transform_matrix(r_and_s, t):
     result = np.eye(4)
     result[:3, :3] = r_and_s
     result[:3, 3] = t
-    return result
\ No newline at end of file
+    return result
+
+
+# Workspace version of get_metric_landmarks, which works in place on preallocated buffers.
+
+
+class GeometryWorkspace:
+    """ GeometryWorkspace class
+
+    Same results as get_metric_landmarks, but every step writes into 3 x N
+    buffers of the workspace instead of creating new arrays, so the geometry
+    of a frame only allocates a few 3 x 3 and 4 x 4 matrices. The parts of the
+    weighted orthogonal problem that only depend on the canonical face model
+    are calculated once.
+
+    The returned metric landmarks are a buffer of the workspace, they are
+    overwritten by the next call. Use one workspace per face (and thread).
+    """
+
+    def __init__(self, pcf, num_landmarks=468):
+        self.pcf = pcf
+        self.num_landmarks = num_landmarks
+
+        # the screen landmarks, the targets of the orthogonal problem and the result
+        self.screen_landmarks = np.empty((3, num_landmarks))
+        self.intermediate_landmarks = np.empty((3, num_landmarks))
+        self.metric_landmarks = np.empty((3, num_landmarks))
+        self.weighted_targets = np.empty((3, num_landmarks))
+        self.design_matrix = np.empty((3, 3))
+
+        sources = canonical_metric_landmarks[:, :num_landmarks]
+        weights = landmark_weights[:num_landmarks]
+        self.sqrt_weights = extract_square_root(weights)
+        self.weights = weights
+        self.total_weight = np.sum(self.sqrt_weights * self.sqrt_weights)
+        weighted_sources = sources * self.sqrt_weights[None, :]
+        source_center_of_mass = np.sum(weighted_sources * self.sqrt_weights[None, :], axis=1) / self.total_weight
+        self.centered_weighted_sources = weighted_sources - np.matmul(
+            source_center_of_mass[:, None], self.sqrt_weights[None, :]
+        )
+        self.centered_weighted_sources_t = np.ascontiguousarray(self.centered_weighted_sources.T)
+        self.denominator = np.sum(self.centered_weighted_sources * weighted_sources)
+        # sum of the weighted sources (weighted twice), for the translation
+        self.source_sum = sources @ weights
+
+    def get_metric_landmarks(self, screen_landmarks):
+        """ Metric landmarks (3 x N, a buffer of the workspace) and the pose transform matrix.
+
+        screen_landmarks are the normalized landmarks, either 3 x N or N x 3
+        (e.g. the rows of a faces x N x 3 array), they are not changed.
+        """
+        if screen_landmarks.shape[0] != 3:
+            screen_landmarks = screen_landmarks.T
+        pcf = self.pcf
+        screen = self.screen_landmarks
+        intermediate = self.intermediate_landmarks
+        metric = self.metric_landmarks
+
+        # project_xy
+        x_scale = pcf.right - pcf.left
+        y_scale = pcf.top - pcf.bottom
+        np.multiply(screen_landmarks[0, :self.num_landmarks], x_scale, out=screen[0])
+        screen[0] += pcf.left
+        np.subtract(1.0, screen_landmarks[1, :self.num_landmarks], out=screen[1])
+        screen[1] *= y_scale
+        screen[1] += pcf.bottom
+        np.multiply(screen_landmarks[2, :self.num_landmarks], x_scale, out=screen[2])
+        depth_offset = np.mean(screen[2])
+
+        # change_handedness of a copy
+        np.copyto(intermediate, screen)
+        intermediate[2] *= -1.0
+        first_iteration_scale = self._estimate_scale(intermediate)
+
+        self._to_metric(depth_offset, first_iteration_scale, intermediate)
+        second_iteration_scale = self._estimate_scale(intermediate)
+
+        self._to_metric(depth_offset, first_iteration_scale * second_iteration_scale, metric)
+        pose_transform_mat = self._solve(metric)
+
+        inv_pose_transform_mat = np.linalg.inv(pose_transform_mat)
+        np.matmul(inv_pose_transform_mat[:3, :3], metric, out=intermediate)
+        np.add(intermediate, inv_pose_transform_mat[:3, 3, None], out=metric)
+
+        return metric, pose_transform_mat
+
+    # move_and_rescale_z, unproject_xy and change_handedness of the screen landmarks into out
+    def _to_metric(self, depth_offset, scale, out):
+        near = self.pcf.near
+        screen = self.screen_landmarks
+        np.subtract(screen[2], depth_offset - near, out=out[2])
+        out[2] /= scale
+        np.multiply(screen[0], out[2], out=out[0])
+        out[0] /= near
+        np.multiply(screen[1], out[2], out=out[1])
+        out[1] /= near
+        out[2] *= -1.0
+
+    def _estimate_scale(self, targets):
+        return np.linalg.norm(self._solve(targets)[:3, 0])
+
+    # solve_weighted_orthogonal_problem with the canonical face model as the sources
+    def _solve(self, targets):
+        weighted_targets = np.multiply(targets, self.sqrt_weights[None, :], out=self.weighted_targets)
+        design_matrix = np.matmul(weighted_targets, self.centered_weighted_sources_t, out=self.design_matrix)
+
+        rotation = compute_optimal_rotation(design_matrix)
+
+        # sum(rotation @ centered_weighted_sources * weighted_targets) without the 3 x N temporaries
+        scale = np.sum(rotation * design_matrix) / self.denominator
+        rotation_and_scale = scale * rotation
+
+        # sum((weighted_targets - rotation_and_scale @ weighted_sources) * sqrt_weights) / total_weight
+        translation = (targets @ self.weights - rotation_and_scale @ self.source_sum) / self.total_weight
+
+        return combine_transform_matrix(rotation_and_scale, translation)
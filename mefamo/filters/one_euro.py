@@ -0,0 +1,59 @@
+import math
+import numpy as np
+
+
+class OneEuroFilterBank():
+    """ OneEuroFilterBank class
+
+    One-Euro filter (Casiez et al. 2012) for a whole vector of channels at once.
+    Slow movements get smoothed strongly (low cutoff), fast movements pass with
+    little lag because the cutoff rises with the speed of the signal. All
+    channels are updated with a single numpy update per frame.
+    """
+
+    def __init__(self, min_cutoff, beta, d_cutoff: float = 1.0) -> None:
+        """ Creates the filter bank.
+
+        Parameters
+        ----------
+        min_cutoff : array like
+            Minimum cutoff frequency in Hz for each channel.
+        beta: array like
+            Speed coefficient for each channel, higher values reduce the lag on fast movements.
+        d_cutoff: float
+            Cutoff frequency in Hz for the derivative.
+        """
+
+        self.min_cutoff = np.asarray(min_cutoff, dtype=np.float64)
+        self.beta = np.asarray(beta, dtype=np.float64)
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self) -> None:
+        self._timestamp = None
+        self._value = None
+        self._derivative = np.zeros_like(self.min_cutoff)
+
+    @staticmethod
+    def _alpha(cutoff, dt):
+        tau = 1.0 / (2 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def filter(self, timestamp: float, values) -> np.ndarray:
+        """ Filters the values of all channels measured at the given timestamp (in seconds). """
+        values = np.asarray(values, dtype=np.float64)
+
+        if self._value is None or timestamp <= self._timestamp:
+            self._timestamp = timestamp
+            self._value = values.copy()
+            return values.copy()
+
+        dt = timestamp - self._timestamp
+        self._timestamp = timestamp
+
+        derivative = (values - self._value) / dt
+        self._derivative += self._alpha(self.d_cutoff, dt) * (derivative - self._derivative)
+
+        cutoff = self.min_cutoff + self.beta * np.abs(self._derivative)
+        self._value += self._alpha(cutoff, dt) * (values - self._value)
+        return self._value.copy()
@@ -0,0 +1,102 @@
+import numpy as np
+
+from pylivelinkface import FaceBlendShape
+
+# the head and eye rotations are angles and must not be clamped to 0 - 1
+ROTATION_START = FaceBlendShape.HeadYaw.value
+
+
+class LatencyPredictor():
+    """ LatencyPredictor class
+
+    Extrapolates all blendshape channels forward in time to compensate the
+    latency of the pipeline (capture, inference, filtering and network).
+    Every channel uses a constant velocity model, either with a plain finite
+    difference ('velocity') or with a per channel Kalman filter ('kalman').
+    All channels are updated at once as numpy arrays.
+    """
+
+    def __init__(self, mode: str = 'kalman', num_channels: int = 61, process_noise: float = 50.0, measurement_noise: float = 1e-3, latency_smoothing: float = 0.1) -> None:
+        if mode not in ('velocity', 'kalman'):
+            raise ValueError(f"Unknown prediction mode '{mode}', use 'velocity' or 'kalman'.")
+
+        self.mode = mode
+        self.num_channels = num_channels
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.latency_smoothing = latency_smoothing
+        self.latency = None
+        self.reset()
+
+    def reset(self) -> None:
+        self._timestamp = None
+        self._position = np.zeros(self.num_channels)
+        self._velocity = np.zeros(self.num_channels)
+        # covariance of the [position, velocity] state, one 2x2 matrix per channel
+        self._p00 = np.ones(self.num_channels)
+        self._p01 = np.zeros(self.num_channels)
+        self._p11 = np.ones(self.num_channels)
+
+    def update(self, timestamp: float, values, latency: float) -> np.ndarray:
+        """ Update the model with the measured values and return the values predicted `latency` seconds ahead.
+
+        Parameters
+        ----------
+        timestamp : float
+            Monotonic capture timestamp of the values in seconds.
+        values: array like
+            The measured blendshape values of this frame.
+        latency: float
+            The measured latency of this frame in seconds, it gets smoothed over time.
+
+        Returns
+        ----------
+        np.ndarray
+            The predicted blendshape values.
+        """
+
+        values = np.asarray(values, dtype=np.float64)
+
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency += self.latency_smoothing * (latency - self.latency)
+
+        if self._timestamp is None or timestamp <= self._timestamp:
+            self._timestamp = timestamp
+            self._position = values.copy()
+            self._velocity[:] = 0
+            return values.copy()
+
+        dt = timestamp - self._timestamp
+        self._timestamp = timestamp
+
+        if self.mode == 'velocity':
+            self._velocity = (values - self._position) / dt
+            self._position = values.copy()
+        else:
+            self._kalman_step(values, dt)
+
+        predicted = self._position + self._velocity * self.latency
+        np.clip(predicted[:ROTATION_START], 0.0, 1.0, out=predicted[:ROTATION_START])
+        return predicted
+
+    def _kalman_step(self, values, dt):
+        # predict with the constant velocity model
+        self._position += self._velocity * dt
+        q = self.process_noise
+        p00 = self._p00 + dt * (2 * self._p01 + dt * self._p11) + q * dt ** 4 / 4
+        p01 = self._p01 + dt * self._p11 + q * dt ** 3 / 2
+        p11 = self._p11 + q * dt ** 2
+
+        # correct with the measured position
+        innovation = values - self._position
+        s = p00 + self.measurement_noise
+        k0 = p00 / s
+        k1 = p01 / s
+        self._position += k0 * innovation
+        self._velocity += k1 * innovation
+
+        self._p00 = (1 - k0) * p00
+        self._p01 = (1 - k0) * p01
+        self._p11 = p11 - k1 * p01
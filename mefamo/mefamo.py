@@ -1,23 +1,32 @@
 import cv2
-import os
-import mediapipe as mp
-from mediapipe.python.solutions import face_mesh, drawing_utils, drawing_styles
 import numpy as np
-import socket
+import sys
 import threading
 import time
 import math
-import transforms3d
-import open3d as o3d
 
-from pylivelinkface import PyLiveLinkFace, FaceBlendShape
+from pylivelinkface import FaceBlendShape
 
 from mefamo.utils.drawing import Drawing
 from mefamo.blendshapes.blendshape_calculator import BlendshapeCalculator
+from mefamo.utils.face_subject import FaceSubject
+from mefamo.utils.face_tracker import FaceTracker
+from mefamo.utils.capture import open_capture, FrameSource
+from mefamo.utils.timing import StageTimer, NULL_TIMER
+from mefamo.utils.tracing import TraceWriter
+from mefamo.network.latency_probe import pack_probe
+from mefamo.network.sender import PacketSender
+from mefamo.takes.take import TakeWriter
+from mefamo.utils.landmark_cache import LandmarkCache
+from mefamo.utils.motion_gate import MotionGate
+from mefamo.utils.idle_mode import IdleMode
+from mefamo.utils.quality_governor import QualityGovernor, tier_settings
+from mefamo.utils.frame_slot import FrameSlot
 
 # taken from: https://github.com/Rassibassi/mediapipeDemos
 from mefamo.custom.face_geometry import (  # isort:skip
     PCF,
+    GeometryWorkspace,
     get_metric_landmarks,
     procrustes_landmark_basis,
 )
@@ -28,8 +37,9 @@ points_idx = points_idx + [key for (key, val) in procrustes_landmark_basis]
 points_idx = list(set(points_idx))
 points_idx.sort()
 
-# Calculates the 3d rotation and 3d landmarks from the 2d landmarks
-def calculate_rotation(face_landmarks, pcf: PCF, image_shape):
+# Calculates the 3d rotation and 3d landmarks from the 2d landmarks, with a workspace (see GeometryWorkspace)
+# the metric landmarks are calculated in its buffers
+def calculate_rotation(face_landmarks, pcf: PCF, image_shape, timer: StageTimer = NULL_TIMER, workspace: GeometryWorkspace = None):
     frame_width, frame_height, channels = image_shape
     focal_length = frame_width
     center = (frame_width / 2, frame_height / 2)
@@ -40,16 +50,21 @@ def calculate_rotation(face_landmarks, pcf: PCF, image_shape):
 
     dist_coeff = np.zeros((4, 1))
 
-    landmarks = np.array(
-        [(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark[:468]]
+    with timer.stage('landmarks'):
+        landmarks = np.array(
+            [(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark[:468]]
 
-    )
-    # print(landmarks.shape)
-    landmarks = landmarks.T
+        )
+        # print(landmarks.shape)
+        landmarks = landmarks.T
 
-    metric_landmarks, pose_transform_mat = get_metric_landmarks(
-        landmarks.copy(), pcf
-    )
+    with timer.stage('metric_landmarks'):
+        if workspace is not None:
+            metric_landmarks, pose_transform_mat = workspace.get_metric_landmarks(landmarks)
+        else:
+            metric_landmarks, pose_transform_mat = get_metric_landmarks(
+                landmarks.copy(), pcf
+            )
 
     model_points = metric_landmarks[0:3, points_idx].T
     image_points = (
@@ -57,36 +72,154 @@ def calculate_rotation(face_landmarks, pcf: PCF, image_shape):
         * np.array([frame_width, frame_height])[None, :]
     )
 
-    success, rotation_vector, translation_vector = cv2.solvePnP(
-        model_points,
-        image_points,
-        camera_matrix,
-        dist_coeff,
-        flags=cv2.SOLVEPNP_ITERATIVE,
-    )
+    with timer.stage('solve_pnp'):
+        success, rotation_vector, translation_vector = cv2.solvePnP(
+            model_points,
+            image_points,
+            camera_matrix,
+            dist_coeff,
+            flags=cv2.SOLVEPNP_ITERATIVE,
+        )
 
     return pose_transform_mat, metric_landmarks, rotation_vector, translation_vector
 
+
+# Same as calculate_rotation, but for all faces of a frame at once (faces x N x 3 normalized landmarks),
+# with workspaces (one per face) the metric landmarks are calculated in their buffers
+def calculate_rotations(multi_face_landmarks: np.ndarray, pcf: PCF, image_shape, timer: StageTimer = NULL_TIMER, workspaces: list = None):
+    frame_width, frame_height, channels = image_shape
+    focal_length = frame_width
+    center = (frame_width / 2, frame_height / 2)
+    camera_matrix = np.array(
+        [[focal_length, 0, center[0]], [0, focal_length, center[1]], [0, 0, 1]],
+        dtype="double",
+    )
+
+    dist_coeff = np.zeros((4, 1))
+
+    with timer.stage('metric_landmarks'):
+        if workspaces is not None:
+            metric_landmarks, pose_transform_mats = zip(*[
+                workspace.get_metric_landmarks(landmarks) for workspace, landmarks in zip(workspaces, multi_face_landmarks)
+            ])
+        else:
+            metric_landmarks, pose_transform_mats = zip(*[
+                get_metric_landmarks(landmarks[:468].T.astype(np.float64), pcf) for landmarks in multi_face_landmarks
+            ])
+
+    results = []
+    with timer.stage('solve_pnp'):
+        for face in range(len(multi_face_landmarks)):
+            model_points = metric_landmarks[face][0:3, points_idx].T
+            image_points = (
+                multi_face_landmarks[face][points_idx, 0:2]
+                * np.array([frame_width, frame_height])[None, :]
+            )
+            success, rotation_vector, translation_vector = cv2.solvePnP(
+                model_points,
+                image_points,
+                camera_matrix,
+                dist_coeff,
+                flags=cv2.SOLVEPNP_ITERATIVE,
+            )
+            results.append((pose_transform_mats[face], metric_landmarks[face], rotation_vector, translation_vector))
+
+    return results
+
+
+# converts a N x 3 landmark array into a NormalizedLandmarkList like mediapipe returns it
+def landmarks_to_proto(landmarks):
+    from mediapipe.framework.formats import landmark_pb2
+    return landmark_pb2.NormalizedLandmarkList(
+        landmark=[landmark_pb2.NormalizedLandmark(x=x, y=y, z=z) for x, y, z in landmarks.tolist()])
+
+
+# draws the face mesh, the contours and the iris points of one face into the image
+def draw_face_mesh(image, face_landmarks):
+    from mediapipe.python.solutions import face_mesh, drawing_utils, drawing_styles
+
+    # draw the face mesh 
+    drawing_utils.draw_landmarks(
+        image=image,
+        landmark_list=face_landmarks,
+        connections=face_mesh.FACEMESH_TESSELATION,
+        landmark_drawing_spec=None,
+        connection_drawing_spec=drawing_styles
+        .get_default_face_mesh_tesselation_style())
+
+    # draw the face contours
+    drawing_utils.draw_landmarks(
+        image=image,
+        landmark_list=face_landmarks,
+        connections=face_mesh.FACEMESH_CONTOURS,
+        landmark_drawing_spec=None,
+        connection_drawing_spec=drawing_styles
+        .get_default_face_mesh_contours_style())
+
+    # draw iris points (only available with refine_landmarks)
+    if len(face_landmarks.landmark) > 473:
+        image = Drawing.draw_landmark_point(face_landmarks.landmark[468], image, color = (0, 0, 255))
+        image = Drawing.draw_landmark_point(face_landmarks.landmark[473], image, color = (0, 255, 0))
+    return image
+
    
 class Mefamo():
-    def __init__(self, input = 0, ip = '127.0.0.1', port = 11111, show_3d = False, hide_image = False, show_debug = False) -> None:
+    def __init__(self, input = 0, ip = '127.0.0.1', port = 11111, show_3d = False, hide_image = False, show_debug = False, output_fps = None, predict = None, predict_extra_latency = 0.0, filter = 'moving_average', profile = False, profile_json = None, trace = None, latency_probe = False, record = None, face_mesh_settings = None, landmark_cache = None, num_faces = 1, warmup_frames = 10, on_ready = None, motion_threshold = None, inference_width = None, frame_budget = None, idle_after = None, idle_fps = 2.0, idle_pose = 'hold', paced = False, drop_frames = True) -> None:
 
         self.input = input
         self.show_image = not hide_image
         self.show_3d = show_3d
         self.show_debug = show_debug
 
-        self.face_mesh = face_mesh.FaceMesh(
-            max_num_faces=1,
+        self.face_mesh_settings = dict(
+            max_num_faces=num_faces,
             refine_landmarks=True,
             min_detection_confidence=0.5,
             min_tracking_confidence=0.5)
+        self.face_mesh_settings.update(face_mesh_settings or {})
+        # mediapipe is only loaded when a Mefamo gets created, the geometry functions above
+        # and the parallel coordinators don't need it
+        from mediapipe.python.solutions import face_mesh, drawing_utils
+        self.face_mesh_class = face_mesh.FaceMesh
+        self.face_mesh = self.face_mesh_class(**self.face_mesh_settings)
+        self.num_faces = self.face_mesh_settings['max_num_faces']
 
-        self.live_link_face = PyLiveLinkFace(fps = 30, filter_size = 4)
         self.blendshape_calulator = BlendshapeCalculator()
 
+        # smoothing of the blendshapes, either the moving average of PyLiveLinkFace or a one euro filter
+        self.filter_size = 4
+        one_euro_cutoffs = None
+        if filter == 'one_euro':
+            # disables the moving average of PyLiveLinkFace
+            self.filter_size = 1
+            config = self.blendshape_calulator.blend_shape_config
+            one_euro_cutoffs = [config.filter_config.get(shape, config.filter_default) for shape in FaceBlendShape]
+        elif filter != 'moving_average':
+            raise ValueError(f"Unknown filter '{filter}', use 'moving_average' or 'one_euro'.")
+
         self.ip = ip
         self.upd_port = port
+
+        # if set, the packets are sent with this rate and interpolated between the captured frames
+        self.output_fps = output_fps
+
+        # optional prediction ('velocity' or 'kalman') to compensate the latency of the pipeline,
+        # the extra latency (in seconds) is added to the measured one, e.g. for the network and Unreal
+        self.predict_extra_latency = predict_extra_latency
+        self.last_capture_time = None
+
+        # one LiveLink subject per face, the tracker keeps every face on the same subject across frames
+        names = ['Python_LiveLinkFace'] if self.num_faces == 1 else [f'Python_LiveLinkFace_{i + 1}' for i in range(self.num_faces)]
+        self.subjects = [FaceSubject(name, self.filter_size, one_euro_cutoffs, predict, output_fps) for name in names]
+        self.one_euro_cutoffs = one_euro_cutoffs
+        self.predict = predict
+        self.face_tracker = FaceTracker(self.num_faces)
+
+        # timings of every stage of the pipeline, shown in the debug window and/or written as json on exit,
+        # with trace set all stages are also written as chrome trace events to that path
+        self.profile_json = profile_json
+        self.tracer = TraceWriter(trace) if trace else None
+        self.timer = StageTimer(enabled = profile or profile_json is not None or trace is not None, tracer = self.tracer)
         
         self.image_height, self.image_width, channels = (480, 640, 3)
 
@@ -105,158 +238,568 @@ class Mefamo():
             frame_width=self.image_width,
             fy=camera_matrix[1, 1],
         )
+        # buffers of the geometry of every face, so it doesn't allocate the landmark arrays for every frame
+        self.geometry_workspaces = [GeometryWorkspace(self.pcf) for _ in range(self.num_faces)]
         self.drawing_spec = drawing_utils.DrawingSpec(thickness=1, circle_radius=1)        
         self.lock = threading.Lock()
         self.got_new_data = False
-        self.network_data = b''
-        self.network_thread = threading.Thread(target=self._network_loop, daemon=True)
+        # one packet per active subject
+        self.network_data = []
+
+        # with the latency probe, the frame id and capture time get appended to every packet,
+        # so a local receiver (see mefamo.network.receiver) can measure the latency
+        self.latency_probe = latency_probe
+        self.frame_id = 0
+        self.network_frame = (0, 0.0)
+        self.packet_seq = 0
+
+        # records the landmarks, pose and blendshapes of every frame into a take file
+        self.take_writer = TakeWriter(record) if record else None
+
+        # folder of the landmark cache for video files, see LandmarkCache
+        self.landmark_cache_dir = landmark_cache
+        self.landmark_cache = None
+
+        # with a motion threshold, the FaceMesh only runs if the region of the faces changed,
+        # otherwise the landmarks and blendshapes of the last frame are used again
+        self.motion_gate = MotionGate(motion_threshold) if motion_threshold is not None else None
+        self.last_multi_face_landmarks = None
+        self.last_recorded_face = (None, None)
+
+        # if set, the FaceMesh gets a copy of the frame scaled down to this width (the landmarks are normalized,
+        # so they fit the full frame), the drawing and the solvePnP still use the full frame
+        self.inference_width = inference_width
+        self.draw_mesh = True
+
+        # image sized buffers of the frame loop by name, see _buffer
+        self._buffers = {}
+
+        # with a frame budget (in seconds), the quality governor lowers the quality settings step by step
+        # while the frames take too long and raises them again when there is enough time left, it is
+        # created when the frame size is known (see _create_governor)
+        self.frame_budget = frame_budget
+        self.governor = None
+
+        # after idle_after frames without a face, only idle_fps frames per second are processed, see IdleMode
+        self.idle_mode = IdleMode(idle_after, idle_fps, pose=idle_pose) if idle_after else None
+
+        # how the frames are read, see FrameSource: paced follows the frame rate of video files,
+        # drop_frames skips the queued camera frames while the processing is behind
+        self.paced = paced
+        self.drop_frames = drop_frames
+        self.frame_source = None
+
+        # number of synthetic frames that run through the pipeline before the capture starts, see warm_up
+        self.warmup_frames = warmup_frames
+        self.warmup_time = None
+        # set (and on_ready called with this Mefamo) when the warm up is done and the capture starts
+        self.ready = threading.Event()
+        self.on_ready = on_ready
+        self.start_time = None
+        self.time_to_first_packet = None
+
+        self.network_thread = threading.Thread(target=self._network_loop, name='network', daemon=True)
+        # the network thread keeps running after start() returned, until close() sets this
+        self.network_stopped = threading.Event()
+
+        # the windows are shown (and the keyboard is read) in their own thread, which always shows the newest
+        # frame, so the processing and sending never wait for the window system. The window system of macOS
+        # only works on the main thread, there the frames are shown after the processing of every frame.
+        self.display_frames = FrameSlot()
+        self.display_closed = threading.Event()
+        self.display_seq = 0
+        self._shown_3d = False
+        self._shown_debug = False
+        self.display_thread = None
+        if sys.platform != 'darwin':
+            self.display_thread = threading.Thread(target=self._display_loop, name='display', daemon=True)
+
+        # the flipped image of every frame for a gui (see examples/mefamo_gui.py), image_frames.read() returns
+        # the newest one with its sequence number, image is the last one for code in the same thread
+        self.image_frames = FrameSlot()
         self.image = None
+
+    # runs the FaceMesh graph and the geometry, blendshape and drawing code on synthetic frames, so the
+    # first captured frames don't pay for the initialization of mediapipe, TFLite, numpy and opencv
+    def warm_up(self, frames = None):
+        frames = self.warmup_frames if frames is None else frames
+        if not frames:
+            return
+        start = time.monotonic()
+
+        from mefamo.utils.synthetic import FaceRenderer
+        renderer = FaceRenderer(self.image_width, self.image_height)
+        # a throwaway subject, so the filters of the real subjects don't see the synthetic faces
+        subject = FaceSubject('warm_up', self.filter_size, self.one_euro_cutoffs, self.predict, self.output_fps)
+
+        for i in range(frames):
+            t = i / frames
+            points = renderer.expression(jaw_open=t, blink=1.0 - t, smile=t)
+            image = renderer.render(renderer.landmarks(points, yaw=0.3 * math.sin(2 * math.pi * t)))
+            if i == frames - 1:
+                # an empty frame last, so the tracking of the FaceMesh starts again with a detection
+                image[:] = 0
+
+            image.flags.writeable = False
+            results = self.face_mesh.process(self._inference_image(image))
+            image.flags.writeable = True
+            multi_face_landmarks = results.multi_face_landmarks
+            if multi_face_landmarks:
+                multi_face_landmarks = multi_face_landmarks[:self.num_faces]
+                landmark_arrays = np.array(
+                    [[(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark[:468]] for face_landmarks in multi_face_landmarks])
+                # the same workspaces as the frames, so their code runs warm as well
+                rotations = calculate_rotations(landmark_arrays, self.pcf, image.shape, workspaces=self.geometry_workspaces)
+                for face_landmarks, (pose_transform_mat, metric_landmarks, rotation_vector, translation_vector) in zip(multi_face_landmarks, rotations):
+                    if self.show_3d:
+                        Drawing.draw_3d_face(metric_landmarks, image)
+                    image = draw_face_mesh(image, face_landmarks)
+                    subject.update(self.blendshape_calulator, metric_landmarks, face_landmarks.landmark,
+                                   pose_transform_mat, time.monotonic())
+            subject.live_link_face.encode()
+            cv2.flip(image, 1)
+
+        self.warmup_time = time.monotonic() - start
+        print(f"Warm up with {frames} frames took {self.warmup_time * 1000:.0f} ms")
+
+    # the LiveLink face of the first subject, which is shown in the debug window and recorded into takes
+    # (a property, a reset of the subject replaces its LiveLink face)
+    @property
+    def live_link_face(self):
+        return self.subjects[0].live_link_face
+
+    # returns the uint8 buffer with the name, which is reused for every frame while its shape stays the same
+    def _buffer(self, name, shape):
+        buffer = self._buffers.get(name)
+        if buffer is None or buffer.shape != shape:
+            buffer = self._buffers[name] = np.empty(shape, dtype=np.uint8)
+        return buffer
+
+    # the width the frames of the given width get scaled to for the FaceMesh, None if they aren't scaled
+    def _effective_inference_width(self, width):
+        inference_width = self.inference_width
+        if self.idle_mode is not None and self.idle_mode.idle:
+            inference_width = min(inference_width or self.idle_mode.inference_width, self.idle_mode.inference_width)
+        if not inference_width or width <= inference_width:
+            return None
+        return inference_width
+
+    # the RGB image for the FaceMesh, optionally scaled down to the inference width
+    def _inference_image(self, image):
+        height, width = image.shape[:2]
+        inference_width = self._effective_inference_width(width)
+        if inference_width is None:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=self._buffer('inference_rgb', image.shape))
+
+        height = max(1, round(height * inference_width / width))
+        scaled = cv2.resize(image, (inference_width, height), dst=self._buffer('inference', (height, inference_width, 3)),
+                            interpolation=cv2.INTER_LINEAR)
+        return cv2.cvtColor(scaled, cv2.COLOR_BGR2RGB, dst=self._buffer('inference_rgb', scaled.shape))
+
+    # the tiers depend on the frame width, scaling the frames to a width they already have changes nothing
+    def _create_governor(self, frame_width):
+        if not self.frame_budget:
+            return
+        self.quality_tiers = tier_settings(dict(
+            show_3d=self.show_3d,
+            show_debug=self.show_debug,
+            inference_width=self.inference_width,
+            draw_mesh=self.draw_mesh,
+            refine_landmarks=self.face_mesh_settings['refine_landmarks']), frame_width=frame_width)
+        self.governor = QualityGovernor(len(self.quality_tiers), self.frame_budget)
+
+    def _set_ready(self):
+        self.ready.set()
+        if self.on_ready is not None:
+            self.on_ready(self)
     
     # starts the program and all its threads
     def start(self):        
         cap = None
         image = None
+        self.start_time = time.monotonic()
+
+        # the warm up runs while the camera opens, which can take seconds as well
+        warmup_thread = threading.Thread(target=self.warm_up, name='warm_up', daemon=True)
+        warmup_thread.start()
 
         # check if input is an image        
         if isinstance(self.input, str) and (self.input.lower().endswith(".jpg") or self.input.lower().endswith(".png")):
             image = cv2.imread(self.input)
             self.file = True   
+            self._create_governor(image.shape[1] if image is not None else None)
         else:   
-            input = self.input  
-            try:
-                input = int(self.input)
-            except ValueError:
-                input = self.input  
-
-        if os.name == 'nt':
-            # will improve webcam input startup on windows 
-            cap = cv2.VideoCapture(input, cv2.CAP_DSHOW)   
-        else:
-            cap = cv2.VideoCapture(input)                
-
-        cap.set(cv2.CAP_PROP_FRAME_WIDTH, self.image_width)
-        cap.set(cv2.CAP_PROP_FRAME_HEIGHT, self.image_height)
+            cap, is_video_file = open_capture(self.input, self.image_width, self.image_height)
+            self.frame_source = FrameSource(cap, is_video_file, self.paced, self.drop_frames)
+            self._create_governor(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+
+            if is_video_file and self.landmark_cache_dir:
+                self.landmark_cache = LandmarkCache(self.landmark_cache_dir, self.input, self.face_mesh_settings,
+                                                    cap.get(cv2.CAP_PROP_FRAME_COUNT),
+                                                    self._effective_inference_width(cap.get(cv2.CAP_PROP_FRAME_WIDTH)))
         
+        warmup_thread.join()
+
         # run the network loop in a separate thread
         self.network_thread.start()
-
-        if cap is not None:
-            # for camera and videos
-            while cap.isOpened():
-                success, image = cap.read()
-                if not success:
-                    print("Ignoring empty camera frame.")
-                    continue
-                if not self._process_image(image):
-                    break    
-            print("Video capture received no more frames.")                
-            cap.release()
+        if self.show_image and self.display_thread is not None:
+            self.display_thread.start()
+        self._set_ready()
+
+        try:
+            if cap is not None:
+                # for camera and videos
+                source = self.frame_source
+                while cap.isOpened():
+                    if self.idle_mode is not None and not self.idle_mode.due(time.monotonic()):
+                        # skip the frame without decoding it
+                        with self.timer.stage('capture'):
+                            success = source.skip()
+                        if not success and is_video_file:
+                            break
+                        continue
+
+                    with self.timer.stage('capture'):
+                        success, image = source.read()
+                    capture_time = time.monotonic()
+                    if not success:
+                        if is_video_file:
+                            break
+                        print("Ignoring empty camera frame.")
+                        continue
+                    if not self._process_image(image, capture_time, source.frame_index):
+                        break    
+                print("Video capture received no more frames.")                
+                if source.dropped:
+                    print(f"Skipped {source.dropped} of {source.frame_index + 1} frames without decoding them")
+                cap.release()
         
-        else:
-            # for input images
-            while image is not None:
-                if not self._process_image(image):
-                    break
+            else:
+                # for input images
+                frame = np.empty_like(image)
+                while image is not None:
+                    if self.idle_mode is not None:
+                        time.sleep(self.idle_mode.wait_time(time.monotonic()))
+                    # the mesh gets drawn into the frame, the face mesh always needs the original image
+                    np.copyto(frame, image)
+                    if not self._process_image(frame):
+                        break
+        finally:
+            if self.display_thread is not None and self.display_thread.is_alive():
+                # closes the windows
+                self.display_closed.set()
+                self.display_thread.join(timeout=1)
+            if self.profile_json:
+                self.timer.dump_json(self.profile_json)
+                print(f"Timings written to {self.profile_json}")
+            if self.tracer is not None:
+                self.tracer.close()
+                print(f"Trace written to {self.tracer.path}")
+            if self.landmark_cache is not None:
+                self.landmark_cache.close()
+                print(f"Landmark cache: {self.landmark_cache.hits} cached frames, {self.landmark_cache.misses} new frames")
+            if self.take_writer is not None:
+                self.take_writer.close()
+                print(f"Take with {self.take_writer.frames} frames written to {self.take_writer.path}")
+
+    # stops the network thread and releases the face mesh, for programs that keep running after start()
+    def close(self):
+        self.network_stopped.set()
+        if self.network_thread.is_alive():
+            self.network_thread.join(timeout=1)
+        self.face_mesh.close()
 
     def _network_loop(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:            
-            s.connect((self.ip, self.upd_port))
-            while True: 
+        with PacketSender(self.ip, self.upd_port) as sender:
+            if self.output_fps:
+                self._scheduled_send_loop(sender)
+            while not self.network_stopped.is_set():
                 with self.lock:
                     if self.got_new_data:                               
-                        s.sendall(self.network_data)
+                        with self.timer.stage('send'):
+                            for data in self.network_data:
+                                self._send(sender, data)
                         self.got_new_data = False
-                time.sleep(0.01)
-
-    def _process_image(self, image):   
-        # To improve performance, optionally mark the image as not writeable to
-        # pass by reference.
-        image.flags.writeable = False
-        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        results = self.face_mesh.process(image)
-
-        # Draw the face mesh annotations on the image.
-        image.flags.writeable = True
-        image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+                self.network_stopped.wait(0.01)
+
+    def _send(self, sender, data):
+        if self.latency_probe:
+            frame_id, capture_time = self.network_frame
+            data += pack_probe(self.packet_seq, frame_id, capture_time, time.monotonic())
+            self.packet_seq += 1
+        if not sender.send(data):
+            return
+        if self.time_to_first_packet is None:
+            self.time_to_first_packet = time.monotonic() - self.start_time
+            print(f"Time to first packet: {self.time_to_first_packet * 1000:.0f} ms")
+
+    # sends interpolated packets with the output rate, independent of the capture rate
+    def _scheduled_send_loop(self, sender):
+        next_send = time.monotonic()
+        while not self.network_stopped.is_set():
+            interval = 1.0 / self.output_fps
+            if self.idle_mode is not None and self.idle_mode.idle:
+                interval = self.idle_mode.interval
+            now = time.monotonic()
+            for subject in self.subjects:
+                values = subject.interpolator.sample(now)
+                if values is None:
+                    continue
+                for shape in FaceBlendShape:
+                    subject.output_live_link_face.set_blendshape(shape, float(values[shape.value]), True)
+                with self.timer.stage('send'):
+                    self._send(sender, subject.output_live_link_face.encode())
+
+            next_send += interval
+            sleep_time = next_send - time.monotonic()
+            if sleep_time > 0:
+                self.network_stopped.wait(sleep_time)
+            else:
+                # we are behind, don't try to catch up with a burst of packets
+                next_send = time.monotonic()
+
+    def _process_image(self, image, capture_time = None, frame_index = None):   
+        if capture_time is None:
+            capture_time = time.monotonic()
+        start = time.perf_counter()
+        with self.timer.stage('frame'):
+            result = self._process_frame(image, capture_time, frame_index)
+        self.timer.frame += 1
+
+        if self.governor is not None and self.governor.update(time.perf_counter() - start):
+            self._set_quality_tier(self.governor.tier)
+        return result
+
+    # applies the settings of a tier of the quality governor
+    def _set_quality_tier(self, tier):
+        name, settings = self.quality_tiers[tier]
+        print(f"Quality tier {tier} ({name}): frame time p90 {self.governor.load * 1000:.1f} ms, "
+              f"budget {self.governor.budget * 1000:.1f} ms")
+
+        self.show_3d = settings['show_3d']
+        self.show_debug = settings['show_debug']
+        self.inference_width = settings['inference_width']
+        self.draw_mesh = settings['draw_mesh']
+
+        if settings['refine_landmarks'] != self.face_mesh_settings['refine_landmarks']:
+            # needs a new graph, the tracking starts again with a detection
+            self.face_mesh_settings['refine_landmarks'] = settings['refine_landmarks']
+            self.face_mesh.close()
+            self.face_mesh = self.face_mesh_class(**self.face_mesh_settings)
+
+    # Allocations per frame: the image sized buffers (the captured frame, the input of the face mesh, the flipped
+    # image, the display frame and the debug window) are reused, see _buffer, FrameSource and FrameSlot. What's left are the results of the face
+    # mesh, the landmark arrays (faces x 468 x 3), the small arrays of the geometry and the packets. Measured with
+    # `python -m benchmarks.bench_pipeline --allocations`: about 80 KiB per frame for every frame size (2.7 MiB at
+    # 640x480 and 7.9 MiB at 1280x720 with an image allocated per step).
+    def _process_frame(self, image, capture_time, frame_index):
+        timer = self.timer
+
+        cached_landmarks = None
+        if self.landmark_cache is not None and frame_index is not None:
+            cached_landmarks = self.landmark_cache.get(frame_index)
+
+        motion_skipped = False
+        if cached_landmarks is None and self.motion_gate is not None and self.last_multi_face_landmarks:
+            with timer.stage('motion_gate'):
+                motion_skipped = not self.motion_gate.changed(image)
+
+        if cached_landmarks is not None:
+            # no inference needed, only the geometry and blendshapes are calculated again
+            with timer.stage('landmark_cache'):
+                multi_face_landmarks = [landmarks_to_proto(landmarks) for landmarks in cached_landmarks]
+        elif motion_skipped:
+            # nothing moved, the landmarks and blendshapes of the last frame are still valid
+            multi_face_landmarks = self.last_multi_face_landmarks
+        else:
+            # To improve performance, optionally mark the image as not writeable to
+            # pass by reference.
+            image.flags.writeable = False
+            with timer.stage('cvt_color'):
+                inference_image = self._inference_image(image)
+            with timer.stage('face_mesh'):
+                results = self.face_mesh.process(inference_image)
+
+            # Draw the face mesh annotations on the image, which is still the full BGR frame.
+            image.flags.writeable = True
+            multi_face_landmarks = results.multi_face_landmarks
+
+            # landmarks of the lower quality tiers of the governor (or the idle mode) don't belong into the cache
+            if (self.landmark_cache is not None and frame_index is not None and
+                    self.landmark_cache.matches(self.face_mesh_settings, self._effective_inference_width(image.shape[1]))):
+                with timer.stage('landmark_cache_put'):
+                    self.landmark_cache.put(frame_index, [np.array([(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark])
+                                                          for face_landmarks in multi_face_landmarks or []])
+
         face_image_3d = None
-        if results.multi_face_landmarks:
-            for face_landmarks in results.multi_face_landmarks:
+        recorded_landmarks = None
+        recorded_pose = None
+        if motion_skipped:
+            recorded_landmarks, recorded_pose = self.last_recorded_face
+        elif multi_face_landmarks:
+            multi_face_landmarks = multi_face_landmarks[:self.num_faces]
+            with timer.stage('landmarks'):
+                landmark_arrays = np.array(
+                    [[(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark[:468]] for face_landmarks in multi_face_landmarks])
+            if self.motion_gate is not None:
+                with timer.stage('motion_gate_update'):
+                    # before the drawing, which changes the image
+                    self.motion_gate.update(image, landmark_arrays)
+            rotations = calculate_rotations(landmark_arrays, self.pcf, image.shape, timer, self.geometry_workspaces)
+
+            # match the faces to the subjects of the last frames by their position in the image (nose tip)
+            slots = self.face_tracker.update(landmark_arrays[:, 1, :2])
+            for slot in self.face_tracker.new_slots:
+                if self.subjects[slot].active:
+                    # another face takes over the subject, its filters shouldn't blend the two faces
+                    self.subjects[slot].reset()
+
+            for face_landmarks, slot, (pose_transform_mat, metric_landmarks, rotation_vector, translation_vector) in zip(multi_face_landmarks, slots, rotations):
+                subject = self.subjects[slot]
 
-                pose_transform_mat, metric_landmarks, rotation_vector, translation_vector = calculate_rotation(face_landmarks, self.pcf, image.shape)  
                 # draw a 3d image of the face
-                if self.show_3d:
-                    face_image_3d = Drawing.draw_3d_face(metric_landmarks, image)
-
-                # draw the face mesh 
-                drawing_utils.draw_landmarks(
-                    image=image,
-                    landmark_list=face_landmarks,
-                    connections=face_mesh.FACEMESH_TESSELATION,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=drawing_styles
-                    .get_default_face_mesh_tesselation_style())
-
-                # draw the face contours
-                drawing_utils.draw_landmarks(
-                    image=image,
-                    landmark_list=face_landmarks,
-                    connections=face_mesh.FACEMESH_CONTOURS,
-                    landmark_drawing_spec=None,
-                    connection_drawing_spec=drawing_styles
-                    .get_default_face_mesh_contours_style())
-            
-                 # draw iris points
-                image = Drawing.draw_landmark_point(face_landmarks.landmark[468], image, color = (0, 0, 255))
-                image = Drawing.draw_landmark_point(face_landmarks.landmark[473], image, color = (0, 255, 0))
-
-                # calculate and set all the blendshapes                
-                self.blendshape_calulator.calculate_blendshapes(
-                    self.live_link_face, metric_landmarks[0:3].T, face_landmarks.landmark)
-
-                # calculate the head rotation out of the pose matrix
-                eulerAngles = transforms3d.euler.mat2euler(pose_transform_mat)
-                pitch = -eulerAngles[0]
-                yaw = eulerAngles[1]
-                roll = eulerAngles[2]
-                self.live_link_face.set_blendshape(
-                    FaceBlendShape.HeadPitch, pitch)
-                self.live_link_face.set_blendshape(
-                    FaceBlendShape.HeadRoll, roll)
-                self.live_link_face.set_blendshape(FaceBlendShape.HeadYaw, yaw)
-
-        # Flip the image horizontally for a selfie-view display.
-        self.image = cv2.flip(image, 1).astype('uint8')
+                if self.show_3d and slot == 0:
+                    with timer.stage('draw_3d'):
+                        face_image_3d = Drawing.draw_3d_face(metric_landmarks, image)
+
+                with timer.stage('blendshapes'):
+                    # calculate and set all the blendshapes and the head rotation
+                    subject.update(self.blendshape_calulator, metric_landmarks, face_landmarks.landmark,
+                                   pose_transform_mat, capture_time, self.predict_extra_latency)
+
+                if self.take_writer is not None and slot == 0:
+                    recorded_landmarks = np.array([(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark])
+                    recorded_pose = pose_transform_mat
+            self.last_recorded_face = (recorded_landmarks, recorded_pose)
+        else:
+            # the slots of the lost faces count the frames without a face as well, until they are released
+            self.face_tracker.update(np.empty((0, 2)))
+            if self.motion_gate is not None:
+                self.motion_gate.update(image, None)
 
-        # Debug format settings
-        white_bg = 0 * np.ones(shape=[720, 720, 3], dtype=np.uint8)
-        text_coordinates = [25, 25]
-        font = cv2.FONT_HERSHEY_SIMPLEX
-        font_scale = 0.50
-        color = (0, 255, 0)
+        if self.motion_gate is not None:
+            self.last_multi_face_landmarks = multi_face_landmarks
+
+        if multi_face_landmarks and self.draw_mesh:
+            with timer.stage('draw_mesh'):
+                for face_landmarks in multi_face_landmarks:
+                    image = draw_face_mesh(image, face_landmarks)
+
+        with timer.stage('flip'):
+            # Flip the image horizontally for a selfie-view display.
+            self.image = cv2.flip(image, 1, dst=self.image_frames.buffer(image.shape))
+            self.image_frames.publish()
 
         if self.show_image:
-            cv2.imshow('MediaPipe Face Mesh', image.astype('uint8'))  
-            if face_image_3d is not None and type(face_image_3d) == o3d.geometry.Image: 
-                # show the 3d image if it exists
-                img_3d = np.asarray(face_image_3d)
-                img_3d = cv2.flip(img_3d, 1)
-                cv2.imshow('Open3D Image', np.asarray(face_image_3d)) 
-
-            if self.show_debug:
-                for shape in FaceBlendShape:
-                    shape_debug_text = f'{shape.name}: {self.live_link_face.get_blendshape(FaceBlendShape(shape.value)):.3f}'
-                    cv2.putText(img=white_bg, text=shape_debug_text, org=tuple(text_coordinates), fontFace=font, fontScale=font_scale, color=color, thickness=1)
-                    text_coordinates[1] += 20
-                    if shape.value == 30: #start new column
-                        text_coordinates = [300, 25]
+            with timer.stage('display'):
+                if self.display_closed.is_set():
+                    return False
+                # a copy, the frame gets reused by the capture
+                np.copyto(self.display_frames.buffer(image.shape), image)
+                blendshapes = self.subjects[0].get_blendshapes() if self.show_debug else None
+                self.display_frames.publish((face_image_3d, blendshapes, self.show_3d, self.show_debug))
+                if self.display_thread is None:
+                    self.display_seq = self._show_newest_frame(self.display_seq)
+
+        if self.idle_mode is not None:
+            self._update_idle_mode(bool(multi_face_landmarks), capture_time)
+
+        self.last_capture_time = capture_time
+        self.frame_id += 1
+
+        if self.take_writer is not None:
+            with timer.stage('record'):
+                self.take_writer.write(capture_time, self.frame_id,
+                    [self.live_link_face.get_blendshape(shape) for shape in FaceBlendShape], recorded_landmarks, recorded_pose)
+
+        # subjects that never had a face aren't sent, so LiveLink only lists the faces that were seen
+        subjects = [subject for subject in self.subjects if subject.active or subject is self.subjects[0]]
+        if self.output_fps:
+            for subject in subjects:
+                subject.interpolator.push(capture_time, subject.get_blendshapes())
+            self.network_frame = (self.frame_id, capture_time)
+        else:
+            with timer.stage('encode'):
+                network_data = [subject.live_link_face.encode() for subject in subjects]
+            with self.lock:
+                self.got_new_data = True
+                self.network_data = network_data
+                self.network_frame = (self.frame_id, capture_time)
 
-                cv2.imshow('Debug', white_bg)
+        return True
 
-            if cv2.waitKey(1) & 0xFF == 27:
-                return False
+    def _update_idle_mode(self, has_face, capture_time):
+        changed = self.idle_mode.update(has_face, capture_time)
+        if changed:
+            print(f"No face for {self.idle_mode.faceless_frames} frames, idle with {1.0 / self.idle_mode.interval:g} fps")
+            if self.idle_mode.pose == 'neutral':
+                for subject in self.subjects:
+                    subject.set_blendshapes([0.0] * len(FaceBlendShape))
+        elif changed is False:
+            print("Found a face, back to the full frame rate")
+
+    def _display_loop(self):
+        seq = 0
+        while not self.display_closed.is_set():
+            seq = self._show_newest_frame(seq, timeout=0.01)
+        cv2.destroyAllWindows()
+
+    # shows the newest frame if it is newer than seq and handles the keyboard (ESC quits), returns the
+    # sequence number of the shown frame
+    def _show_newest_frame(self, seq, timeout=None):
+        frame = self.display_frames.read(seq, timeout)
+        if frame is not None:
+            seq, image, (face_image_3d, blendshapes, show_3d, show_debug) = frame
+            with self.timer.stage('imshow'):
+                self._show_images(image, face_image_3d, blendshapes, show_3d, show_debug)
+                key = cv2.waitKey(1)
+        else:
+            # only handles the keyboard, not a stage of a frame
+            key = cv2.waitKey(1)
+        if key & 0xFF == 27:
+            self.display_closed.set()
+        return seq
+
+    # shows the image, 3d image and debug windows, closes the windows of the ones that got disabled
+    def _show_images(self, image, face_image_3d, blendshapes, show_3d, show_debug):
+        for window, shown, enabled in (('Open3D Image', self._shown_3d, show_3d), ('Debug', self._shown_debug, show_debug)):
+            if shown and not enabled:
+                try:
+                    cv2.destroyWindow(window)
+                except cv2.error:
+                    pass
+        self._shown_3d = self._shown_3d and show_3d
+        self._shown_debug = show_debug
 
-        with self.lock:
-            self.got_new_data = True
-            self.network_data = self.live_link_face.encode()
+        # Debug format settings
+        debug_width = 1020 if self.timer.enabled else 720
+        white_bg = None
+        if show_debug:
+            white_bg = self._buffer('debug', (720, debug_width, 3))
+            white_bg.fill(0)
+        text_coordinates = [25, 25]
+        font = cv2.FONT_HERSHEY_SIMPLEX
+        font_scale = 0.50
+        color = (0, 255, 0)
 
-        return True
+        cv2.imshow('MediaPipe Face Mesh', image)
+        if face_image_3d is not None: 
+            # show the 3d image if it exists
+            cv2.imshow('Open3D Image', np.asarray(face_image_3d)) 
+            self._shown_3d = True
+
+        if show_debug:
+            for shape in FaceBlendShape:
+                shape_debug_text = f'{shape.name}: {blendshapes[shape.value]:.3f}'
+                cv2.putText(img=white_bg, text=shape_debug_text, org=tuple(text_coordinates), fontFace=font, fontScale=font_scale, color=color, thickness=1)
+                text_coordinates[1] += 20
+                if shape.value == 30: #start new column
+                    text_coordinates = [300, 25]
+
+            # timings of the stages as p50 / p90 / p99
+            text_coordinates = [720, 25]
+            for timing_text in self.timer.summary_lines():
+                cv2.putText(img=white_bg, text=timing_text, org=tuple(text_coordinates), fontFace=font, fontScale=font_scale, color=color, thickness=1)
+                text_coordinates[1] += 20
+
+            cv2.imshow('Debug', white_bg)
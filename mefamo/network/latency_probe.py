@@ -0,0 +1,23 @@
+import struct
+
+# trailer appended to the LiveLink packets when the latency probe is enabled:
+# magic, packet sequence number, frame id, capture time and send time (time.monotonic() seconds)
+PROBE_MAGIC = b'MFMO'
+PROBE_FORMAT = '!4sIIdd'
+PROBE_SIZE = struct.calcsize(PROBE_FORMAT)
+
+
+def pack_probe(packet_seq: int, frame_id: int, capture_time: float, send_time: float) -> bytes:
+    """ Creates the trailer that gets appended to an encoded PyLiveLinkFace packet. """
+    return struct.pack(PROBE_FORMAT, PROBE_MAGIC, packet_seq & 0xFFFFFFFF, frame_id & 0xFFFFFFFF, capture_time, send_time)
+
+
+def split_probe(data: bytes):
+    """ Splits a received packet into the LiveLink payload and the probe (packet_seq, frame_id, capture_time, send_time).
+
+    The probe is None if the packet has no trailer.
+    """
+    if len(data) > PROBE_SIZE and data[-PROBE_SIZE:-PROBE_SIZE + 4] == PROBE_MAGIC:
+        _, packet_seq, frame_id, capture_time, send_time = struct.unpack(PROBE_FORMAT, data[-PROBE_SIZE:])
+        return data[:-PROBE_SIZE], (packet_seq, frame_id, capture_time, send_time)
+    return data, None
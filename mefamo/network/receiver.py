@@ -0,0 +1,132 @@
+import socket
+import threading
+import time
+import numpy as np
+
+from pylivelinkface import PyLiveLinkFace
+
+from mefamo.network.latency_probe import split_probe
+
+
+class LiveLinkReceiver():
+    """ LiveLinkReceiver class
+
+    Local stand-in for the Unreal LiveLink plugin. It receives and decodes the
+    PyLiveLinkFace packets and, if MeFaMo runs with the latency probe enabled,
+    measures the latency from the capture of a frame to the arrival of its
+    packet (glass-to-packet), the jitter, the packet loss and reordering.
+
+    The capture and send timestamps are time.monotonic() values of the sender,
+    so the receiver needs to run on the same machine.
+    """
+
+    def __init__(self, ip: str = '127.0.0.1', port: int = 11111) -> None:
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind((ip, port))
+        self.socket.settimeout(0.2)
+        self.port = self.socket.getsockname()[1]
+
+        self.last_face = None
+        self.packets = 0
+        self.decode_errors = 0
+        self._latencies = []
+        self._network_latencies = []
+        self._packet_seqs = []
+        self._frame_ids = []
+        self._running = False
+        self._thread = None
+        # CPU time (in seconds) of the receiving thread, so it can be told apart from the sender's
+        self.cpu_time = 0.0
+
+    def start(self) -> None:
+        """ Receives the packets in a background thread until stop() is called. """
+        self._running = True
+        self._thread = threading.Thread(target=self._receive_loop, name='receiver', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+        self.socket.close()
+
+    def _receive_loop(self):
+        cpu_start = time.thread_time()
+        while self._running:
+            try:
+                data = self.socket.recv(4096)
+            except socket.timeout:
+                continue
+            self.handle_packet(data, time.monotonic())
+            self.cpu_time = time.thread_time() - cpu_start
+
+    def handle_packet(self, data: bytes, receive_time: float) -> None:
+        """ Decodes one packet and records its latency. """
+        self.packets += 1
+        payload, probe = split_probe(data)
+        try:
+            success, face = PyLiveLinkFace.decode(payload)
+            if success:
+                self.last_face = face
+        except Exception:
+            self.decode_errors += 1
+
+        if probe is not None:
+            packet_seq, frame_id, capture_time, send_time = probe
+            self._latencies.append(receive_time - capture_time)
+            self._network_latencies.append(receive_time - send_time)
+            self._packet_seqs.append(packet_seq)
+            self._frame_ids.append(frame_id)
+
+    def report(self, bucket_ms: float = 5.0) -> dict:
+        """ Returns the latency percentiles and histogram, jitter, loss and reordering of all received packets with a probe. """
+        report = {'packets': self.packets, 'decode_errors': self.decode_errors, 'probed_packets': len(self._latencies)}
+        if not self._latencies:
+            return report
+
+        latencies = np.array(self._latencies) * 1000
+        network = np.array(self._network_latencies) * 1000
+        seqs = np.array(self._packet_seqs, dtype=np.int64)
+        frame_ids = np.array(self._frame_ids, dtype=np.int64)
+
+        # RFC 3550 style jitter: smoothed difference of the latencies of consecutive packets
+        jitter = 0.0
+        for diff in np.abs(np.diff(network)):
+            jitter += (diff - jitter) / 16
+
+        expected = seqs.max() - seqs.min() + 1
+        unique_frames = np.unique(frame_ids)
+        report.update({
+            'latency_ms': {f'p{p}': float(np.percentile(latencies, p)) for p in (50, 90, 99)},
+            'network_latency_ms': {f'p{p}': float(np.percentile(network, p)) for p in (50, 90, 99)},
+            'jitter_ms': float(jitter),
+            'lost_packets': int(expected - len(np.unique(seqs))),
+            'reordered_packets': int(np.sum(seqs[1:] < np.maximum.accumulate(seqs)[:-1])),
+            # frames the sender replaced with a newer one before it could send them
+            'skipped_frames': int(unique_frames.max() - unique_frames.min() + 1 - len(unique_frames)),
+        })
+
+        edges = np.arange(0, latencies.max() + bucket_ms, bucket_ms)
+        counts, edges = np.histogram(latencies, bins=edges if len(edges) > 1 else 1)
+        report['latency_histogram'] = [(float(start), int(count)) for start, count in zip(edges[:-1], counts)]
+        return report
+
+    @staticmethod
+    def format_report(report: dict) -> str:
+        """ Formats the report for the console. """
+        lines = [f'packets: {report["packets"]} ({report["probed_packets"]} with latency probe, {report["decode_errors"]} decode errors)']
+        if 'latency_ms' not in report:
+            return '\n'.join(lines)
+
+        latency = report['latency_ms']
+        network = report['network_latency_ms']
+        lines.append(f'glass-to-packet latency: p50 {latency["p50"]:.1f} / p90 {latency["p90"]:.1f} / p99 {latency["p99"]:.1f} ms')
+        lines.append(f'send-to-packet latency:  p50 {network["p50"]:.2f} / p90 {network["p90"]:.2f} / p99 {network["p99"]:.2f} ms')
+        lines.append(f'jitter: {report["jitter_ms"]:.2f} ms, lost: {report["lost_packets"]}, '
+                     f'reordered: {report["reordered_packets"]}, skipped frames: {report["skipped_frames"]}')
+
+        largest = max(count for _, count in report['latency_histogram'])
+        for start, count in report['latency_histogram']:
+            bar = '#' * int(round(40 * count / largest)) if largest else ''
+            lines.append(f'{start:>7.1f} ms {count:>6} {bar}')
+        return '\n'.join(lines)
@@ -0,0 +1,43 @@
+import socket
+
+
+class PacketSender():
+    """ PacketSender class
+
+    Sends the LiveLink packets over a connected UDP socket. Sending fails with
+    an OSError (e.g. ConnectionRefusedError) while nothing listens on the port,
+    for example while Unreal is still starting. These packets are dropped, like
+    any lost UDP packet, instead of stopping the sending. Only the first
+    failure is printed: without a listener every second packet fails (the
+    error is the ICMP reply to the packet before), so the failures and
+    successes alternate.
+    """
+
+    def __init__(self, ip: str, port: int) -> None:
+        self.address = (ip, port)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.connect(self.address)
+        self.sent = 0
+        self.failed = 0
+
+    def send(self, data: bytes) -> bool:
+        """ Sends one packet, returns False if it was dropped. """
+        try:
+            self.socket.sendall(data)
+        except OSError as e:
+            if not self.failed:
+                print(f"Sending to {self.address[0]}:{self.address[1]} failed ({e}), is the receiver running? The packets are dropped while it fails.")
+            self.failed += 1
+            return False
+        self.sent += 1
+        return True
+
+    def close(self) -> None:
+        self.socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
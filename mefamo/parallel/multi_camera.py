@@ -0,0 +1,299 @@
+import multiprocessing
+import time
+import numpy as np
+
+from pylivelinkface import FaceBlendShape
+
+from mefamo.blendshapes.blendshape_calculator import BlendshapeCalculator
+from mefamo.custom.face_geometry import PCF, GeometryWorkspace
+from mefamo.mefamo import calculate_rotations
+from mefamo.network.latency_probe import pack_probe
+from mefamo.network.sender import PacketSender
+from mefamo.parallel.shared_ring import SharedRing
+from mefamo.utils.capture import open_capture
+from mefamo.utils.face_subject import FaceSubject
+from mefamo.utils.face_tracker import FaceTracker
+
+NUM_LANDMARKS = 478
+
+
+def result_dtype(max_faces: int) -> np.dtype:
+    """ Record of the FaceMesh result of one frame, as the camera workers write it into their ring. """
+    return np.dtype([
+        ('capture_time', '<f8'),        # time.monotonic() of the capture in seconds
+        ('frame_id', '<u4'),
+        ('image_shape', '<u4', (3,)),
+        ('num_faces', 'u1'),
+        ('num_landmarks', '<u2'),       # 468, or 478 with the iris landmarks of refine_landmarks
+        ('landmarks', '<f4', (max_faces, NUM_LANDMARKS, 3)), # normalized mediapipe landmarks
+    ])
+
+
+def write_result(ring: SharedRing, capture_time: float, frame_id: int, image_shape, multi_face_landmarks) -> None:
+    """ Writes the FaceMesh result of one frame into the next record of the ring and publishes it. """
+    record = ring.claim()
+    record['capture_time'] = capture_time
+    record['frame_id'] = frame_id
+    record['image_shape'] = image_shape
+    record['num_faces'] = len(multi_face_landmarks)
+    record['num_landmarks'] = 0
+    for i, face_landmarks in enumerate(multi_face_landmarks):
+        landmarks = np.array([(lm.x, lm.y, lm.z) for lm in face_landmarks.landmark])
+        record['landmarks'][i, :len(landmarks)] = landmarks
+        record['num_landmarks'] = len(landmarks)
+    ring.publish()
+
+
+def camera_worker(input, ring_name: str, capacity: int, face_mesh_settings: dict, width: int, height: int, stop_event) -> None:
+    """ Captures the frames of one camera (or video) and runs the FaceMesh on them, in its own process.
+
+    The landmarks of every frame are written into the shared ring of the camera.
+    The frames of video files wait for the coordinator, instead of being dropped.
+    """
+
+    import cv2
+    from mediapipe.python.solutions import face_mesh
+
+    ring = SharedRing(result_dtype(face_mesh_settings['max_num_faces']), capacity, name=ring_name)
+    cap, is_video_file = open_capture(input, width, height)
+    mesh = face_mesh.FaceMesh(**face_mesh_settings)
+    frame_id = 0
+    try:
+        while cap.isOpened() and not stop_event.is_set():
+            success, image = cap.read()
+            capture_time = time.monotonic()
+            if not success:
+                if is_video_file:
+                    break
+                continue
+
+            image.flags.writeable = False
+            results = mesh.process(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+            faces = (results.multi_face_landmarks or [])[:face_mesh_settings['max_num_faces']]
+
+            while is_video_file and ring.free_slots() <= 0 and not stop_event.is_set():
+                time.sleep(0.001)
+
+            write_result(ring, capture_time, frame_id, image.shape, faces)
+            frame_id += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cap.release()
+        mesh.close()
+        ring.finish()
+        ring.close()
+
+
+class _Camera():
+    # state of one camera in the coordinator
+    def __init__(self, index, input, ring, subjects) -> None:
+        self.index = index
+        self.input = input
+        self.ring = ring
+        self.subjects = subjects
+        self.tracker = FaceTracker(len(subjects))
+        self.geometry_workspaces = []
+        self.process = None
+        self.next_seq = 0
+        self.frames = 0
+        self.dropped = 0
+        self.first_capture_time = None
+        self.last_capture_time = None
+        self.interval_frames = 0
+        self.fps = 0.0
+
+
+class MultiCameraMefamo():
+    """ MultiCameraMefamo class
+
+    Runs the capture and FaceMesh of several cameras (or videos) in one worker
+    process per camera, so they don't share the GIL and the startup of the
+    cameras happens in parallel. The workers write their landmarks into a
+    SharedRing per camera. This process is the coordinator: it reads the
+    landmarks, calculates the geometry and blendshapes, sends one LiveLink
+    subject per camera and face and reports the frame rate of every camera.
+
+    There are no image windows in this mode.
+    """
+
+    def __init__(self, inputs: list, ip: str = '127.0.0.1', port: int = 11111, num_faces: int = 1, filter: str = 'moving_average',
+                 predict: str = None, predict_extra_latency: float = 0.0, face_mesh_settings: dict = None,
+                 latency_probe: bool = False, report_interval: float = 2.0, ring_capacity: int = 8) -> None:
+        self.inputs = list(inputs)
+        self.ip = ip
+        self.upd_port = port
+        self.predict_extra_latency = predict_extra_latency
+        self.latency_probe = latency_probe
+        self.report_interval = report_interval
+        self.ring_capacity = ring_capacity
+
+        self.face_mesh_settings = dict(
+            max_num_faces=num_faces,
+            refine_landmarks=True,
+            min_detection_confidence=0.5,
+            min_tracking_confidence=0.5)
+        self.face_mesh_settings.update(face_mesh_settings or {})
+        self.num_faces = self.face_mesh_settings['max_num_faces']
+
+        self.blendshape_calulator = BlendshapeCalculator()
+        self.filter_size = 4
+        self.one_euro_cutoffs = None
+        if filter == 'one_euro':
+            self.filter_size = 1
+            config = self.blendshape_calulator.blend_shape_config
+            self.one_euro_cutoffs = [config.filter_config.get(shape, config.filter_default) for shape in FaceBlendShape]
+        elif filter != 'moving_average':
+            raise ValueError(f"Unknown filter '{filter}', use 'moving_average' or 'one_euro'.")
+        self.predict = predict
+
+        self.image_height, self.image_width = (480, 640)
+        self.pcf = PCF(
+            near=1,
+            far=10000,
+            frame_height=self.image_height,
+            frame_width=self.image_width,
+            fy=self.image_width,
+        )
+        self.packet_seq = 0
+        self.cameras = []
+        # all started processes and created rings, to stop and release them at the end
+        self.processes = []
+        self.rings = []
+
+    def _subject_names(self, camera):
+        if self.num_faces == 1:
+            return [f'Python_LiveLinkFace_cam{camera + 1}']
+        return [f'Python_LiveLinkFace_cam{camera + 1}_{face + 1}' for face in range(self.num_faces)]
+
+    # starts the workers and runs the coordinator until all videos ended or the program gets interrupted
+    def start(self):
+        # spawn, so the workers don't inherit the state of this process (and it works the same on windows)
+        context = multiprocessing.get_context('spawn')
+        stop_event = context.Event()
+
+        try:
+            self._start_workers(context, stop_event)
+            with PacketSender(self.ip, self.upd_port) as sender:
+                self._coordinator_loop(sender)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop_event.set()
+            for process in self.processes:
+                process.join(timeout=5)
+                if process.is_alive():
+                    process.terminate()
+            for ring in self.rings:
+                ring.close()
+            print(self.format_report())
+
+    # creates a camera with its subjects and a result ring, the coordinator reads the ring
+    # until it is finished or the process of the camera ended
+    def _add_camera(self, input):
+        index = len(self.cameras)
+        ring = SharedRing(result_dtype(self.num_faces), self.ring_capacity)
+        self.rings.append(ring)
+        subjects = [FaceSubject(name, self.filter_size, self.one_euro_cutoffs, self.predict)
+                    for name in self._subject_names(index)]
+        camera = _Camera(index, input, ring, subjects)
+        camera.geometry_workspaces = [GeometryWorkspace(self.pcf) for _ in subjects]
+        self.cameras.append(camera)
+        return camera
+
+    def _start_process(self, context, name, target, *args):
+        process = context.Process(target=target, name=name, daemon=True, args=args)
+        process.start()
+        self.processes.append(process)
+        return process
+
+    def _start_workers(self, context, stop_event):
+        for input in self.inputs:
+            camera = self._add_camera(input)
+            camera.process = self._start_process(
+                context, f'camera{camera.index}', camera_worker,
+                input, camera.ring.name, self.ring_capacity, self.face_mesh_settings, self.image_width, self.image_height, stop_event)
+
+    def _coordinator_loop(self, sender):
+        record = np.empty((), dtype=result_dtype(self.num_faces))
+        last_report = time.monotonic()
+        while True:
+            got_data = False
+            running = False
+            for camera in self.cameras:
+                ring = camera.ring
+                # check before reading, so no record gets lost between the last read and the end of the worker
+                finished = ring.finished or not camera.process.is_alive()
+                head = ring.head
+                if head - camera.next_seq > ring.capacity:
+                    # the coordinator fell behind, the oldest records are already overwritten
+                    camera.dropped += head - ring.capacity - camera.next_seq
+                    camera.next_seq = head - ring.capacity
+                while camera.next_seq < head:
+                    if ring.read(camera.next_seq, out=record) is not None:
+                        self._process_record(camera, record, sender)
+                        got_data = True
+                    else:
+                        camera.dropped += 1
+                    camera.next_seq += 1
+                ring.consumed(camera.next_seq)
+                running = running or not finished
+
+            now = time.monotonic()
+            if now - last_report >= self.report_interval:
+                for camera in self.cameras:
+                    camera.fps = camera.interval_frames / (now - last_report)
+                    camera.interval_frames = 0
+                print(self.format_report())
+                last_report = now
+
+            if not running:
+                break
+            if not got_data:
+                time.sleep(0.001)
+
+    def _process_record(self, camera, record, sender):
+        capture_time = float(record['capture_time'])
+        num_faces = int(record['num_faces'])
+        if num_faces:
+            landmarks = record['landmarks'][:num_faces]
+            rotations = calculate_rotations(landmarks, self.pcf, tuple(record['image_shape']), workspaces=camera.geometry_workspaces)
+            slots = camera.tracker.update(landmarks[:, 1, :2])
+            for slot in camera.tracker.new_slots:
+                if camera.subjects[slot].active:
+                    # another face takes over the subject, its filters shouldn't blend the two faces
+                    camera.subjects[slot].reset()
+            for face, slot in enumerate(slots):
+                pose_transform_mat, metric_landmarks, rotation_vector, translation_vector = rotations[face]
+                camera.subjects[slot].update(self.blendshape_calulator, metric_landmarks, landmarks[face],
+                                             pose_transform_mat, capture_time, self.predict_extra_latency)
+        else:
+            # the slots of the lost faces count the frames without a face as well, until they are released
+            camera.tracker.update(np.empty((0, 2)))
+
+        for subject in camera.subjects:
+            if not (subject.active or subject is camera.subjects[0]):
+                continue
+            data = subject.live_link_face.encode()
+            if self.latency_probe:
+                data += pack_probe(self.packet_seq, int(record['frame_id']), capture_time, time.monotonic())
+                self.packet_seq += 1
+            # dropped if nothing listens on the port (yet), the cameras keep running
+            sender.send(data)
+
+        if camera.first_capture_time is None:
+            camera.first_capture_time = capture_time
+        camera.last_capture_time = capture_time
+        camera.frames += 1
+        camera.interval_frames += 1
+
+    def format_report(self) -> str:
+        """ Frame rate of every camera, of the last report interval and on average. """
+        lines = []
+        for camera in self.cameras:
+            average = 0.0
+            if camera.frames > 1 and camera.last_capture_time > camera.first_capture_time:
+                average = (camera.frames - 1) / (camera.last_capture_time - camera.first_capture_time)
+            lines.append(f'camera {camera.index} ({camera.input}): {camera.fps:.1f} fps, {average:.1f} fps average, '
+                         f'{camera.frames} frames, {camera.dropped} dropped')
+        return '\n'.join(lines)
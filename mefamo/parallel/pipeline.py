@@ -0,0 +1,206 @@
+import time
+import numpy as np
+
+from mefamo.parallel.multi_camera import MultiCameraMefamo, result_dtype, write_result
+from mefamo.parallel.shared_ring import SharedRing
+from mefamo.utils.capture import open_capture, is_video_file
+
+
+def frame_dtype(max_width: int, max_height: int) -> np.dtype:
+    """ Record of one captured frame. The image has the maximum size, image_shape is the size of the frame in it. """
+    return np.dtype([
+        ('capture_time', '<f8'),        # time.monotonic() of the capture in seconds
+        ('frame_id', '<u4'),
+        ('image_shape', '<u4', (3,)),
+        ('image', 'u1', (max_height, max_width, 3)),
+    ])
+
+
+def _next_seq(ring: SharedRing, seq: int, in_order: bool) -> int:
+    # video files are read frame by frame, cameras skip to the newest frame to keep the latency low
+    head = ring.head
+    if not in_order:
+        return max(seq, head - 1)
+    return max(seq, head - ring.capacity)
+
+
+def capture_stage(input, frame_ring_name: str, capacity: int, max_frame_size: tuple, width: int, height: int, stop_event) -> None:
+    """ Captures the frames and writes them into the frame ring. """
+    import cv2
+
+    max_width, max_height = max_frame_size
+    frames = SharedRing(frame_dtype(max_width, max_height), capacity, name=frame_ring_name)
+    cap, video_file = open_capture(input, width, height)
+    frame_id = 0
+    try:
+        while cap.isOpened() and not stop_event.is_set():
+            # frames of video files wait for the inference instead of being dropped
+            if video_file and frames.free_slots() <= 0:
+                time.sleep(0.001)
+                continue
+
+            success, image = cap.read()
+            capture_time = time.monotonic()
+            if not success:
+                if video_file:
+                    break
+                continue
+
+            frame_height, frame_width = image.shape[:2]
+            if frame_width > max_width or frame_height > max_height:
+                scale = min(max_width / frame_width, max_height / frame_height)
+                image = cv2.resize(image, (int(frame_width * scale), int(frame_height * scale)), interpolation=cv2.INTER_AREA)
+                frame_height, frame_width = image.shape[:2]
+
+            record = frames.claim()
+            record['capture_time'] = capture_time
+            record['frame_id'] = frame_id
+            record['image_shape'] = image.shape
+            record['image'][:frame_height, :frame_width] = image
+            frames.publish()
+            frame_id += 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cap.release()
+        frames.finish()
+        frames.close()
+
+
+def inference_stage(frame_ring_name: str, frame_capacity: int, max_frame_size: tuple, result_ring_name: str, result_capacity: int,
+                    face_mesh_settings: dict, in_order: bool, stop_event) -> None:
+    """ Runs the FaceMesh on the frames of the frame ring and writes the landmarks into the result ring. """
+    import cv2
+    from mediapipe.python.solutions import face_mesh
+
+    frames = SharedRing(frame_dtype(*max_frame_size), frame_capacity, name=frame_ring_name)
+    results = SharedRing(result_dtype(face_mesh_settings['max_num_faces']), result_capacity, name=result_ring_name)
+    mesh = face_mesh.FaceMesh(**face_mesh_settings)
+    seq = 0
+    try:
+        while not stop_event.is_set():
+            finished = frames.finished
+            seq = _next_seq(frames, seq, in_order)
+            record = frames.view(seq)
+            if record is None:
+                if finished and seq >= frames.head:
+                    break
+                time.sleep(0.001)
+                continue
+
+            capture_time = float(record['capture_time'])
+            frame_id = int(record['frame_id'])
+            frame_height, frame_width, channels = record['image_shape']
+            image = cv2.cvtColor(record['image'][:frame_height, :frame_width], cv2.COLOR_BGR2RGB)
+            valid = frames.valid(seq)
+            seq += 1
+            frames.consumed(seq)
+            if not valid:
+                # the capture overwrote the frame while it was converted
+                continue
+
+            image.flags.writeable = False
+            faces = (mesh.process(image).multi_face_landmarks or [])[:face_mesh_settings['max_num_faces']]
+
+            while in_order and results.free_slots() <= 0 and not stop_event.is_set():
+                time.sleep(0.001)
+            write_result(results, capture_time, frame_id, (frame_height, frame_width, channels), faces)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mesh.close()
+        results.finish()
+        results.close()
+        frames.close()
+
+
+def display_stage(frame_ring_name: str, frame_capacity: int, max_frame_size: tuple, result_ring_name: str, result_capacity: int,
+                  max_faces: int, stop_event) -> None:
+    """ Draws the newest landmarks into their frame and shows it, ESC stops the pipeline. """
+    import cv2
+    from mefamo.mefamo import draw_face_mesh, landmarks_to_proto
+
+    frames = SharedRing(frame_dtype(*max_frame_size), frame_capacity, name=frame_ring_name)
+    results = SharedRing(result_dtype(max_faces), result_capacity, name=result_ring_name)
+    result = np.empty((), dtype=results.dtype)
+    seq = 0
+    try:
+        while not stop_event.is_set():
+            finished = results.finished
+            seq = _next_seq(results, seq, in_order=False)
+            if results.read(seq, out=result) is None:
+                if finished and seq >= results.head:
+                    break
+                time.sleep(0.001)
+                continue
+            seq += 1
+
+            frame_id = int(result['frame_id'])
+            record = frames.view(frame_id)
+            if record is None:
+                continue
+            frame_height, frame_width = result['image_shape'][:2]
+            image = record['image'][:frame_height, :frame_width].copy()
+            if not frames.valid(frame_id):
+                continue
+
+            # only the landmarks of this frame, the iris landmarks of the record are stale without refine_landmarks
+            num_landmarks = int(result['num_landmarks'])
+            for landmarks in result['landmarks'][:int(result['num_faces'])]:
+                image = draw_face_mesh(image, landmarks_to_proto(landmarks[:num_landmarks]))
+
+            # Flip the image horizontally for a selfie-view display.
+            cv2.imshow('MediaPipe Face Mesh', cv2.flip(image, 1))
+            if cv2.waitKey(1) & 0xFF == 27:
+                stop_event.set()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        cv2.destroyAllWindows()
+        results.close()
+        frames.close()
+
+
+class PipelineMefamo(MultiCameraMefamo):
+    """ PipelineMefamo class
+
+    Runs the pipeline of one input in stages, every stage in its own process:
+    the capture, the FaceMesh inference, the display and the geometry,
+    blendshapes and network in this process. The stages don't share the GIL,
+    so they run in parallel on several cores, at the cost of one frame of
+    latency per stage.
+
+    The frames go through a SharedRing of the maximum frame size (larger
+    frames get scaled down) and the landmarks through a second one, neither
+    gets pickled. For video files every frame is processed, with a webcam
+    every stage takes the newest frame of the stage before.
+    """
+
+    def __init__(self, input, ip: str = '127.0.0.1', port: int = 11111, hide_image: bool = False, max_frame_size: tuple = (1920, 1080), **kwargs) -> None:
+        super().__init__([input], ip, port, **kwargs)
+        self.show_image = not hide_image
+        self.max_frame_size = max_frame_size
+
+    def _subject_names(self, camera):
+        # the same subjects as Mefamo
+        if self.num_faces == 1:
+            return ['Python_LiveLinkFace']
+        return [f'Python_LiveLinkFace_{face + 1}' for face in range(self.num_faces)]
+
+    def _start_workers(self, context, stop_event):
+        input = self.inputs[0]
+        in_order = is_video_file(input)
+        frames = SharedRing(frame_dtype(*self.max_frame_size), self.ring_capacity)
+        self.rings.append(frames)
+        camera = self._add_camera(input)
+
+        self._start_process(context, 'capture', capture_stage,
+                            input, frames.name, self.ring_capacity, self.max_frame_size, self.image_width, self.image_height, stop_event)
+        # the coordinator runs until the inference ended
+        camera.process = self._start_process(context, 'inference', inference_stage,
+                                             frames.name, self.ring_capacity, self.max_frame_size, camera.ring.name, self.ring_capacity,
+                                             self.face_mesh_settings, in_order, stop_event)
+        if self.show_image:
+            self._start_process(context, 'display', display_stage,
+                                frames.name, self.ring_capacity, self.max_frame_size, camera.ring.name, self.ring_capacity,
+                                self.num_faces, stop_event)
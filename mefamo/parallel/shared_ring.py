@@ -0,0 +1,134 @@
+import numpy as np
+from multiprocessing import shared_memory
+
+# head (number of published records), the finished flag and the consumed sequence number
+_HEADER_SIZE = 24
+
+
+def _align(size: int, alignment: int = 64) -> int:
+    return (size + alignment - 1) // alignment * alignment
+
+
+class SharedRing():
+    """ SharedRing class
+
+    Fixed size ring buffer of numpy records in shared memory, to move frames and
+    landmarks between processes without pickling them. There is one writing
+    process and any number of reading processes.
+
+    The writer fills the next slot in place (claim) and publishes it with an
+    increasing sequence number (publish). Every slot stores the sequence number
+    of its record, which is invalidated while the slot gets written. A reader
+    copies a record and checks the sequence number before and after the copy, so
+    it never returns a record that was overwritten in between (a seqlock). A
+    reader that falls behind by more than the capacity loses the oldest records,
+    unless the reader reports its progress (consumed) and the writer waits for
+    free slots (free_slots), e.g. for video files that shouldn't lose frames.
+
+    Create the ring in one process and attach to it in the processes it starts
+    with its name:
+
+        ring = SharedRing(dtype, capacity)
+        # in the other process
+        ring = SharedRing(dtype, capacity, name=ring.name)
+    """
+
+    def __init__(self, dtype: np.dtype, capacity: int = 8, name: str = None) -> None:
+        self.dtype = np.dtype(dtype)
+        self.capacity = capacity
+        self._owner = name is None
+
+        seqs_offset = _HEADER_SIZE
+        records_offset = _align(seqs_offset + 8 * capacity)
+        size = records_offset + self.dtype.itemsize * capacity
+
+        # the child processes share the resource tracker of their parent, so attaching doesn't
+        # register the memory a second time and only the creating process unlinks it
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=size if self._owner else 0)
+        self.name = self._shm.name
+
+        buffer = self._shm.buf
+        self._header = np.ndarray((3,), dtype=np.int64, buffer=buffer)
+        self._seqs = np.ndarray((capacity,), dtype=np.int64, buffer=buffer, offset=seqs_offset)
+        self.records = np.ndarray((capacity,), dtype=self.dtype, buffer=buffer, offset=records_offset)
+        if self._owner:
+            self._header[:] = 0
+            self._seqs[:] = -1
+
+    @property
+    def head(self) -> int:
+        """ Sequence number of the next record, i.e. the number of published records. """
+        return int(self._header[0])
+
+    @property
+    def finished(self) -> bool:
+        """ True if the writer won't publish any more records. """
+        return bool(self._header[1])
+
+    def free_slots(self) -> int:
+        """ Number of slots the writer can fill without overwriting records the reader hasn't consumed yet. """
+        return self.capacity - (self.head - int(self._header[2]))
+
+    def consumed(self, seq: int) -> None:
+        """ Reports that the reader is done with all records up to (excluding) seq. """
+        self._header[2] = seq
+
+    def claim(self) -> np.ndarray:
+        """ Returns the next slot for the writer to fill in place, publish() makes it visible to the readers. """
+        slot = self.head % self.capacity
+        self._seqs[slot] = -1
+        return self.records[slot]
+
+    def publish(self) -> int:
+        """ Publishes the claimed slot and returns its sequence number. """
+        seq = self.head
+        self._seqs[seq % self.capacity] = seq
+        self._header[0] = seq + 1
+        return seq
+
+    def write(self, **fields) -> int:
+        """ Writes and publishes one record, given as its field values. """
+        record = self.claim()
+        for key, value in fields.items():
+            record[key] = value
+        return self.publish()
+
+    def read(self, seq: int, out: np.ndarray = None):
+        """ Copies the record with the sequence number into out (or a new record).
+
+        Returns None if the record isn't published yet or was already overwritten.
+        """
+        slot = seq % self.capacity
+        if self._seqs[slot] != seq:
+            return None
+        if out is None:
+            out = np.empty((), dtype=self.dtype)
+        out[...] = self.records[slot]
+        if self._seqs[slot] != seq:
+            return None
+        return out
+
+    def view(self, seq: int):
+        """ Returns the slot of the record with the sequence number without copying it, or None.
+
+        The slot can get overwritten while it is used, check with valid(seq) after using it.
+        """
+        slot = seq % self.capacity
+        if self._seqs[slot] != seq:
+            return None
+        return self.records[slot]
+
+    def valid(self, seq: int) -> bool:
+        """ True if the record with the sequence number is still in the ring. """
+        return self._seqs[seq % self.capacity] == seq
+
+    def finish(self) -> None:
+        """ Marks the ring as finished, e.g. at the end of a video. """
+        self._header[1] = 1
+
+    def close(self) -> None:
+        # the numpy views have to be released before the memory can be closed
+        del self._header, self._seqs, self.records
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
@@ -0,0 +1,63 @@
+import time
+
+from pylivelinkface import PyLiveLinkFace, FaceBlendShape
+
+from mefamo.network.sender import PacketSender
+from mefamo.takes.take import read_take
+
+
+def replay_take(path: str, ip: str = '127.0.0.1', port: int = 11111, realtime: bool = True, loop: bool = False, fps: int = 30) -> int:
+    """ Streams a recorded take to LiveLink.
+
+    Only the recorded blendshapes are sent, neither mediapipe nor a camera is needed.
+
+    Parameters
+    ----------
+    path : str
+        Path of the take file.
+    ip: str
+        IP address of the Unreal LiveLink server.
+    port: int
+        Port of the Unreal LiveLink server.
+    realtime: bool
+        If True, the frames are sent with the timing of the recording, otherwise as fast as possible.
+    loop: bool
+        If True, the take is replayed until the program gets stopped.
+    fps: int
+        Frame rate that gets written into the LiveLink packets.
+
+    Returns
+    ----------
+    int
+        The number of sent frames, frames that couldn't be sent (e.g. while the receiver
+        isn't running yet) are dropped and not counted.
+    """
+
+    frames = read_take(path)
+    if len(frames) == 0:
+        print(f"The take {path} has no frames.")
+        return 0
+
+    live_link_face = PyLiveLinkFace(fps = fps, filter_size = 1)
+    timestamps = frames['timestamp']
+    blendshapes = frames['blendshapes']
+    sent = 0
+
+    with PacketSender(ip, port) as sender:
+        while True:
+            start = time.monotonic()
+            for i in range(len(frames)):
+                if realtime:
+                    sleep_time = start + (timestamps[i] - timestamps[0]) - time.monotonic()
+                    if sleep_time > 0:
+                        time.sleep(sleep_time)
+
+                values = blendshapes[i].tolist()
+                for shape in FaceBlendShape:
+                    live_link_face.set_blendshape(shape, values[shape.value], True)
+                if sender.send(live_link_face.encode()):
+                    sent += 1
+
+            if not loop:
+                break
+    return sent
@@ -0,0 +1,88 @@
+import struct
+import numpy as np
+
+# a take file is a 64 byte header followed by fixed size records, so it can be appended
+# to while recording and memory mapped for the replay
+TAKE_MAGIC = b'MFMOTAKE'
+TAKE_VERSION = 1
+HEADER_FORMAT = '<8sII'
+HEADER_SIZE = 64
+
+TAKE_DTYPE = np.dtype([
+    ('timestamp', '<f8'),           # time.monotonic() of the capture in seconds
+    ('frame_id', '<u4'),
+    ('has_face', 'u1'),
+    ('landmarks', '<f4', (478, 3)), # normalized mediapipe landmarks
+    ('pose', '<f4', (4, 4)),        # pose transform matrix
+    ('blendshapes', '<f4', (61,)),  # the blendshape values that were sent
+])
+
+
+class TakeWriter():
+    """ TakeWriter class
+
+    Appends the recorded frames to a take file. The frames are collected in a
+    preallocated chunk and written to the file when the chunk is full, so
+    recording doesn't write to the disk every frame.
+    """
+
+    def __init__(self, path: str, chunk_size: int = 64) -> None:
+        self.path = path
+        self.frames = 0
+        self._chunk = np.zeros(chunk_size, dtype=TAKE_DTYPE)
+        self._chunk_fill = 0
+        self._file = open(path, 'wb')
+        header = struct.pack(HEADER_FORMAT, TAKE_MAGIC, TAKE_VERSION, TAKE_DTYPE.itemsize)
+        self._file.write(header.ljust(HEADER_SIZE, b'\0'))
+
+    def write(self, timestamp: float, frame_id: int, blendshapes, landmarks: np.ndarray = None, pose: np.ndarray = None) -> None:
+        """ Adds one frame to the take, landmarks and pose are None if no face was found. """
+        record = self._chunk[self._chunk_fill]
+        record['timestamp'] = timestamp
+        record['frame_id'] = frame_id
+        record['blendshapes'] = blendshapes
+        record['has_face'] = landmarks is not None
+        if landmarks is not None:
+            count = min(len(landmarks), 478)
+            record['landmarks'][:count] = landmarks[:count]
+            record['landmarks'][count:] = 0
+        else:
+            record['landmarks'] = 0
+        record['pose'] = pose if pose is not None else 0
+
+        self._chunk_fill += 1
+        self.frames += 1
+        if self._chunk_fill == len(self._chunk):
+            self.flush()
+
+    def flush(self) -> None:
+        """ Appends all collected frames to the file. """
+        if self._chunk_fill:
+            self._file.write(self._chunk[:self._chunk_fill].tobytes())
+            self._file.flush()
+            self._chunk_fill = 0
+
+    def close(self) -> None:
+        self.flush()
+        self._file.close()
+
+
+def read_take(path: str) -> np.ndarray:
+    """ Memory maps a take file and returns its frames as a numpy record array (of TAKE_DTYPE).
+
+    Frames of a take that is still recorded (or wasn't closed) are returned up to the last complete one.
+    """
+    with open(path, 'rb') as f:
+        magic, version, record_size = struct.unpack(HEADER_FORMAT, f.read(struct.calcsize(HEADER_FORMAT)))
+        f.seek(0, 2)
+        file_size = f.tell()
+
+    if magic != TAKE_MAGIC:
+        raise ValueError(f'{path} is not a MeFaMo take file.')
+    if version != TAKE_VERSION or record_size != TAKE_DTYPE.itemsize:
+        raise ValueError(f'{path} has an unsupported take version {version}.')
+
+    frames = (file_size - HEADER_SIZE) // record_size
+    if frames == 0:
+        return np.zeros(0, dtype=TAKE_DTYPE)
+    return np.memmap(path, dtype=TAKE_DTYPE, mode='r', offset=HEADER_SIZE, shape=(frames,))
@@ -0,0 +1,122 @@
+import os
+import time
+import cv2
+
+
+def is_video_file(input) -> bool:
+    """ True if the input is a local video file, False for a webcam (integer or integer string) or a stream (e.g. an rtsp:// url). """
+    try:
+        int(input)
+    except ValueError:
+        return os.path.isfile(input)
+    return False
+
+
+def open_capture(input, width: int, height: int):
+    """ Opens a webcam (integer or integer string), a video file or a stream (any other input OpenCV can open).
+
+    Returns
+    ----------
+    tuple
+        The cv2.VideoCapture and True if the input is a local video file, which ends
+        (cameras and streams can deliver empty frames from time to time).
+    """
+
+    video_file = is_video_file(input)
+    try:
+        input = int(input)
+    except ValueError:
+        pass
+
+    if os.name == 'nt':
+        # will improve webcam input startup on windows
+        cap = cv2.VideoCapture(input, cv2.CAP_DSHOW)
+    else:
+        cap = cv2.VideoCapture(input)
+
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    return cap, video_file
+
+
+class FrameSource():
+    """ FrameSource class
+
+    Reads the frames of an opened capture. Frames that won't be processed are
+    only grabbed, so they don't get decoded:
+
+    * Cameras and streams: the driver queues the frames that arrive while a
+      frame gets processed. With drop_frames, all but the newest of them are
+      skipped, as far as the queue (CAP_PROP_BUFFERSIZE) holds them.
+    * Local video files: every frame is read, or with paced the frames follow
+      the frame rate of the video. Frames that are due are skipped while the
+      processing is behind, and reading waits while it is ahead.
+
+    frame_index is the index of the last frame (including the skipped ones).
+    The frames are decoded into the same image, which is only valid until the
+    next read.
+    """
+
+    def __init__(self, cap, video_file: bool, paced: bool = False, drop_frames: bool = True) -> None:
+        self.cap = cap
+        self.video_file = video_file
+        self.paced = paced
+        self.drop_frames = drop_frames
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.interval = 1.0 / fps if fps > 0 else 1.0 / 30
+        # without a known queue size no frames are dropped, skipping more frames than queued would wait for new ones
+        buffer_size = int(cap.get(cv2.CAP_PROP_BUFFERSIZE))
+        self.buffer_size = buffer_size if buffer_size > 0 else 1
+
+        self.image = None
+        self.frame_index = -1
+        self.dropped = 0
+        self.start_time = None
+        self.last_read_time = None
+
+    def skip(self) -> bool:
+        """ Grabs the next frame without decoding it, returns False if there is none (e.g. at the end of a video). """
+        if not self.cap.grab():
+            return False
+        self.frame_index += 1
+        self.dropped += 1
+        # a skipped frame was taken from the queue as well, the next read shouldn't count the time
+        # of the skipped frames (e.g. in the idle mode) as frames that queued up
+        self.last_read_time = time.monotonic()
+        return True
+
+    def read(self):
+        """ Returns success and the image of the next frame to process, like cv2.VideoCapture.read(). """
+        for _ in range(self._frames_behind()):
+            if not self.skip():
+                return False, None
+
+        if not self.cap.grab():
+            return False, None
+        self.frame_index += 1
+        self.last_read_time = time.monotonic()
+        if self.start_time is None:
+            self.start_time = self.last_read_time
+        success, image = self.cap.retrieve(self.image)
+        if success:
+            self.image = image
+        return success, image
+
+    # number of frames to skip before the next frame
+    def _frames_behind(self):
+        now = time.monotonic()
+        if self.video_file:
+            if not self.paced or self.start_time is None:
+                return 0
+            next_index = self.frame_index + 1
+            next_time = self.start_time + next_index * self.interval
+            if next_time > now:
+                time.sleep(next_time - now)
+                return 0
+            return int((now - self.start_time) / self.interval) - next_index
+
+        if not self.drop_frames or self.last_read_time is None:
+            return 0
+        queued = int((now - self.last_read_time) / self.interval)
+        return max(0, min(queued, self.buffer_size) - 1)
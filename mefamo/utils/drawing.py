@@ -1,11 +1,9 @@
-from mediapipe.python.solutions import face_mesh, drawing_utils, drawing_styles
-import open3d as o3d
-import open3d.visualization.rendering as rendering
 import cv2
 
 class Drawing():
         
     def draw_landmark_point(landmark, image, color = (255, 0, 0), radius = 5):
+        from mediapipe.python.solutions import drawing_utils
         try:
             image_rows, image_cols, _ = image.shape
             keypoint_px = drawing_utils._normalized_to_pixel_coordinates(landmark.x, landmark.y,
@@ -20,6 +18,10 @@ class Drawing():
         # create pointcloid with open3d
         frame_width, frame_height, channels = image.shape
         try:
+            # open3d takes seconds to import, so it is only loaded for the 3d image
+            import open3d as o3d
+            import open3d.visualization.rendering as rendering
+
             render = rendering.OffscreenRenderer(frame_width, frame_height)        
             vector = o3d.utility.Vector3dVector(landmarks[0:3].T)
             pcd = o3d.geometry.PointCloud(vector)
@@ -0,0 +1,114 @@
+import time
+import uuid
+
+from pylivelinkface import PyLiveLinkFace, FaceBlendShape
+
+from mefamo.utils.interpolation import BlendshapeInterpolator, matrix_to_euler
+from mefamo.filters.predictor import LatencyPredictor
+from mefamo.filters.one_euro import OneEuroFilterBank
+
+
+class FaceSubject():
+    """ FaceSubject class
+
+    The state of one tracked face: its LiveLink subject and the filters,
+    predictor and interpolator of its blendshapes. Every face keeps its own
+    state, so the smoothing of one face isn't mixed with the values of another.
+    """
+
+    def __init__(self, name: str, filter_size: int, one_euro_cutoffs: list = None, predict: str = None, output_fps: float = None) -> None:
+        self.filter_size = filter_size
+        self.output_fps = output_fps
+        # every subject needs its own uuid, otherwise LiveLink merges them
+        self.live_link_face = PyLiveLinkFace(name = name, uuid = str(uuid.uuid1()), fps = 30, filter_size = filter_size)
+
+        self.one_euro_filter = None
+        if one_euro_cutoffs is not None:
+            self.one_euro_filter = OneEuroFilterBank(
+                min_cutoff=[cutoff for cutoff, beta in one_euro_cutoffs],
+                beta=[beta for cutoff, beta in one_euro_cutoffs])
+
+        self.predictor = LatencyPredictor(predict) if predict else None
+
+        self.interpolator = BlendshapeInterpolator()
+        self.output_live_link_face = None
+        if output_fps:
+            self.output_live_link_face = PyLiveLinkFace(name = name, uuid = self.live_link_face.uuid, fps = int(output_fps))
+
+        self.last_capture_time = None
+        # True once the subject got its first face
+        self.active = False
+
+    def reset(self) -> None:
+        """ Forgets the filtered values, e.g. when the subject gets the slot of another face. """
+        # the moving average of PyLiveLinkFace can't be cleared, the subject keeps its name and uuid
+        self.live_link_face = PyLiveLinkFace(name = self.live_link_face.name, uuid = self.live_link_face.uuid, fps = 30, filter_size = self.filter_size)
+        if self.one_euro_filter is not None:
+            self.one_euro_filter.reset()
+        if self.predictor is not None:
+            self.predictor.reset()
+        self.interpolator = BlendshapeInterpolator()
+        self.last_capture_time = None
+
+    def update(self, calculator, metric_landmarks, normalized_landmarks, pose_transform_mat, capture_time: float, extra_latency: float = 0.0) -> None:
+        """ Calculates the blendshapes and head rotation of the face, filters and predicts them.
+
+        Parameters
+        ----------
+        calculator : BlendshapeCalculator
+            Calculator of the blendshapes.
+        metric_landmarks: np.ndarray
+            The metric landmarks of the face (3 x N).
+        normalized_landmarks:
+            The normalized landmarks of mediapipe, either the landmark protos or a N x 3 array.
+        pose_transform_mat: np.ndarray
+            The pose transform matrix of the face.
+        capture_time: float
+            time.monotonic() of the capture of the frame.
+        extra_latency: float
+            Latency (in seconds) that gets added to the measured one for the prediction.
+        """
+
+        live_link_face = self.live_link_face
+        calculator.calculate_blendshapes(live_link_face, metric_landmarks[0:3].T, normalized_landmarks)
+
+        # calculate the head rotation out of the pose matrix
+        eulerAngles = matrix_to_euler(pose_transform_mat)
+        pitch = -eulerAngles[0]
+        yaw = eulerAngles[1]
+        roll = eulerAngles[2]
+        live_link_face.set_blendshape(FaceBlendShape.HeadPitch, pitch)
+        live_link_face.set_blendshape(FaceBlendShape.HeadRoll, roll)
+        live_link_face.set_blendshape(FaceBlendShape.HeadYaw, yaw)
+
+        if self.one_euro_filter is not None:
+            self.set_blendshapes(self.one_euro_filter.filter(capture_time, self.get_blendshapes()))
+
+        if self.predictor is not None:
+            self._predict_blendshapes(capture_time, extra_latency)
+
+        self.active = True
+        self.last_capture_time = capture_time
+
+    # extrapolates the blendshapes forward by the latency of the pipeline
+    def _predict_blendshapes(self, capture_time, extra_latency):
+        frame_interval = 1.0 / 30
+        if self.last_capture_time is not None and capture_time > self.last_capture_time:
+            frame_interval = capture_time - self.last_capture_time
+
+        # the moving average of PyLiveLinkFace lags behind by half of its window
+        filter_latency = (self.filter_size - 1) / 2 * frame_interval
+        latency = time.monotonic() - capture_time + filter_latency + extra_latency
+        if self.output_fps:
+            # the interpolation is delayed by one capture interval
+            latency += frame_interval
+
+        self.set_blendshapes(self.predictor.update(capture_time, self.get_blendshapes(), latency))
+
+    def get_blendshapes(self) -> list:
+        return [self.live_link_face.get_blendshape(shape) for shape in FaceBlendShape]
+
+    def set_blendshapes(self, values) -> None:
+        """ Sets all blendshapes without the moving average filter. """
+        for shape in FaceBlendShape:
+            self.live_link_face.set_blendshape(shape, float(values[shape.value]), True)
@@ -0,0 +1,60 @@
+import numpy as np
+
+
+class FaceTracker():
+    """ FaceTracker class
+
+    Gives every face a stable id (slot) across frames, so every face keeps
+    driving the same LiveLink subject. mediapipe returns the faces of a frame in
+    no particular order, so the faces are matched to the faces of the previous
+    frames by the distance of their centers (greedy, closest pairs first).
+
+    A slot stays reserved for max_missing frames after its face got lost, so a
+    face that is missed for a few frames gets its old slot back. new_slots are
+    the slots that got a new face in the last update, their subjects should
+    forget the filter state of the face before.
+    """
+
+    def __init__(self, max_faces: int, max_distance: float = 0.2, max_missing: int = 15) -> None:
+        self.max_faces = max_faces
+        # in normalized image coordinates
+        self.max_distance = max_distance
+        self.max_missing = max_missing
+        self.centers = np.zeros((max_faces, 2))
+        # number of frames since the face of the slot was seen, -1 for free slots
+        self.missing = np.full(max_faces, -1)
+        self.new_slots = []
+
+    def update(self, centers: np.ndarray) -> list:
+        """ Matches the face centers (F x 2, normalized) of the current frame to the slots and returns the slot of every face. """
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)[:self.max_faces]
+        slots = [-1] * len(centers)
+
+        used = self.missing >= 0
+        if len(centers) and used.any():
+            distances = np.linalg.norm(centers[:, None, :] - self.centers[None, :, :], axis=2)
+            distances[:, ~used] = np.inf
+            for index in np.argsort(distances, axis=None):
+                face, slot = np.unravel_index(index, distances.shape)
+                if distances[face, slot] > self.max_distance:
+                    break
+                if slots[face] >= 0 or slot in slots:
+                    continue
+                slots[face] = int(slot)
+
+        # new faces get the first free slot, or the one that was missed for the longest time
+        self.new_slots = []
+        for face in range(len(centers)):
+            if slots[face] >= 0:
+                continue
+            candidates = [slot for slot in range(self.max_faces) if slot not in slots]
+            free = [slot for slot in candidates if self.missing[slot] < 0]
+            slots[face] = free[0] if free else max(candidates, key=lambda slot: self.missing[slot])
+            self.new_slots.append(slots[face])
+
+        self.missing[used] += 1
+        for face, slot in enumerate(slots):
+            self.centers[slot] = centers[face]
+            self.missing[slot] = 0
+        self.missing[self.missing > self.max_missing] = -1
+        return slots
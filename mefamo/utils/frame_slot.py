@@ -0,0 +1,58 @@
+import threading
+import numpy as np
+
+
+class FrameSlot():
+    """ FrameSlot class
+
+    Hands the newest frame from one producer thread to one consumer thread,
+    without blocking either of them for longer than a swap and without
+    allocating a frame per frame. There are three buffers: the producer writes
+    into its own one, publish() swaps it with the ready slot and read() swaps
+    the ready slot with the buffer of the consumer. So neither side ever sees
+    a buffer the other side writes into. A frame that isn't read before the
+    next publish is dropped, the consumer always gets the newest one.
+
+    Every published frame gets a sequence number (starting with 1), the
+    consumer passes the last one it got to read() to only get new frames.
+    """
+
+    def __init__(self) -> None:
+        self._condition = threading.Condition()
+        self._write = None
+        self._ready = None
+        self._read = None
+        self._ready_data = None
+        self._ready_new = False
+        # number of published frames, the sequence number of the newest frame
+        self.seq = 0
+
+    def buffer(self, shape: tuple, dtype = np.uint8) -> np.ndarray:
+        """ The buffer for the producer to write the next frame into. """
+        if self._write is None or self._write.shape != shape or self._write.dtype != dtype:
+            self._write = np.empty(shape, dtype=dtype)
+        return self._write
+
+    def publish(self, data = None) -> int:
+        """ Publishes the frame in the buffer (and the data that belongs to it), returns its sequence number. """
+        with self._condition:
+            self._write, self._ready = self._ready, self._write
+            self._ready_data = data
+            self._ready_new = True
+            self.seq += 1
+            self._condition.notify_all()
+            return self.seq
+
+    def read(self, last_seq: int = 0, timeout: float = None):
+        """ Returns (seq, image, data) of the newest frame, or None if there is none newer than last_seq.
+
+        Waits up to timeout seconds for a new frame. The image stays valid until
+        the next read.
+        """
+        with self._condition:
+            if not self._ready_new or self.seq <= last_seq:
+                if not timeout or not self._condition.wait_for(lambda: self._ready_new and self.seq > last_seq, timeout):
+                    return None
+            self._read, self._ready = self._ready, self._read
+            self._ready_new = False
+            return self.seq, self._read, self._ready_data
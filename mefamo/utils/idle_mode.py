@@ -0,0 +1,48 @@
+class IdleMode():
+    """ IdleMode class
+
+    Tracks if there was a face in the last frames. After after_frames processed
+    frames without a face the capture goes idle: only fps frames per second are
+    processed (the others are skipped without decoding them), on a smaller
+    image and the packets are only sent with that rate. The first frame with a
+    face ends the idle mode.
+
+    In idle the subjects either hold their last pose ('hold') or get all
+    blendshapes and the head rotation set to 0 ('neutral').
+    """
+
+    def __init__(self, after_frames: int = 90, fps: float = 2.0, inference_width: int = 320, pose: str = 'hold') -> None:
+        if pose not in ('hold', 'neutral'):
+            raise ValueError(f"Unknown idle pose '{pose}', use 'hold' or 'neutral'.")
+        self.after_frames = after_frames
+        self.interval = 1.0 / fps
+        self.inference_width = inference_width
+        self.pose = pose
+
+        self.idle = False
+        self.faceless_frames = 0
+        self.next_time = 0.0
+
+    def due(self, now: float) -> bool:
+        """ True if the frame captured at now (time.monotonic()) should be processed. """
+        return not self.idle or now >= self.next_time
+
+    def wait_time(self, now: float) -> float:
+        """ Seconds until the next frame should be processed. """
+        return max(0.0, self.next_time - now) if self.idle else 0.0
+
+    def update(self, has_face: bool, now: float):
+        """ Updates the state with a processed frame, returns True when the idle mode starts, False when it ends and None otherwise. """
+        if has_face:
+            self.faceless_frames = 0
+            if self.idle:
+                self.idle = False
+                return False
+            return None
+
+        self.faceless_frames += 1
+        self.next_time = now + self.interval
+        if not self.idle and self.faceless_frames >= self.after_frames:
+            self.idle = True
+            return True
+        return None
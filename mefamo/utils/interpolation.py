@@ -0,0 +1,129 @@
+import threading
+import time
+import numpy as np
+
+from pylivelinkface import FaceBlendShape
+
+# indices of the head rotation inside the blendshape vector
+HEAD_INDICES = [FaceBlendShape.HeadPitch.value, FaceBlendShape.HeadYaw.value, FaceBlendShape.HeadRoll.value]
+
+_EULER_EPSILON = np.finfo(float).eps * 4.0
+
+
+def euler_to_quaternion(ai, aj, ak):
+    """ Converts static xyz euler angles (like transforms3d's 'sxyz') to a quaternion [w, x, y, z]. """
+    ci, si = np.cos(ai / 2), np.sin(ai / 2)
+    cj, sj = np.cos(aj / 2), np.sin(aj / 2)
+    ck, sk = np.cos(ak / 2), np.sin(ak / 2)
+    return np.array([
+        ci * cj * ck + si * sj * sk,
+        si * cj * ck - ci * sj * sk,
+        ci * sj * ck + si * cj * sk,
+        ci * cj * sk - si * sj * ck,
+    ])
+
+
+def matrix_to_euler(mat):
+    """ Extracts static xyz euler angles (like transforms3d's mat2euler with 'sxyz') from a rotation or pose matrix. """
+    cy = np.hypot(mat[0, 0], mat[1, 0])
+    if cy > _EULER_EPSILON:
+        ai = np.arctan2(mat[2, 1], mat[2, 2])
+        aj = np.arctan2(-mat[2, 0], cy)
+        ak = np.arctan2(mat[1, 0], mat[0, 0])
+    else:
+        # gimbal lock, the roll can't be separated from the pitch
+        ai = np.arctan2(-mat[1, 2], mat[1, 1])
+        aj = np.arctan2(-mat[2, 0], cy)
+        ak = 0.0
+    return ai, aj, ak
+
+
+def quaternion_to_euler(q):
+    """ Converts a quaternion [w, x, y, z] back to static xyz euler angles. """
+    w, x, y, z = q
+    ai = np.arctan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    aj = np.arcsin(np.clip(2 * (w * y - z * x), -1.0, 1.0))
+    ak = np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return ai, aj, ak
+
+
+def slerp(q0, q1, t):
+    """ Spherical linear interpolation between the quaternions q0 and q1. """
+    dot = np.dot(q0, q1)
+    # take the short way around
+    if dot < 0.0:
+        q1 = -q1
+        dot = -dot
+
+    if dot > 0.9995:
+        # quaternions are almost the same, lerp is precise enough and stable
+        result = q0 + t * (q1 - q0)
+        return result / np.linalg.norm(result)
+
+    theta_0 = np.arccos(dot)
+    theta = theta_0 * t
+    sin_theta_0 = np.sin(theta_0)
+    s0 = np.sin(theta_0 - theta) / sin_theta_0
+    s1 = np.sin(theta) / sin_theta_0
+    return s0 * q0 + s1 * q1
+
+
+def head_to_quaternion(values):
+    # the pitch is inverted when it gets written into the blendshapes
+    pitch, yaw, roll = values[HEAD_INDICES]
+    return euler_to_quaternion(-pitch, yaw, roll)
+
+
+class BlendshapeInterpolator():
+    """ BlendshapeInterpolator class
+
+    Keeps the last two solved frames with their monotonic timestamps and
+    interpolates between them, so the LiveLink packets can be sent at a higher
+    rate than the capture rate. Blendshapes are interpolated linearly, the head
+    rotation with slerp.
+
+    The output is delayed by one capture interval: when a new frame arrives the
+    previous one is sent and the new one is reached one interval later. The
+    interpolation starts when a frame is pushed, not at its capture time,
+    otherwise the processing latency would already be a part of the interval
+    and the output would jump most of the way to the new frame.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._frames = []
+
+    def push(self, timestamp: float, values, arrival_time: float = None) -> None:
+        """ Adds a solved frame (61 blendshape values) captured at the given monotonic timestamp.
+
+        arrival_time is the monotonic time the frame was solved, time.monotonic() if not set.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if arrival_time is None:
+            arrival_time = time.monotonic()
+        frame = (timestamp, arrival_time, values, head_to_quaternion(values))
+        with self._lock:
+            self._frames = self._frames[-1:] + [frame]
+
+    def sample(self, timestamp: float):
+        """ Returns the interpolated blendshape values for the given monotonic timestamp, or None if no frame was pushed yet. """
+        with self._lock:
+            frames = self._frames
+
+        if not frames:
+            return None
+        if len(frames) == 1:
+            return frames[0][2].copy()
+
+        (t0, _, v0, q0), (t1, arrival_time, v1, q1) = frames
+        # the capture interval, the arrival times jitter with the processing time
+        interval = t1 - t0
+        if interval <= 0:
+            return v1.copy()
+
+        alpha = min(max((timestamp - arrival_time) / interval, 0.0), 1.0)
+        values = v0 + alpha * (v1 - v0)
+
+        pitch, yaw, roll = quaternion_to_euler(slerp(q0, q1, alpha))
+        values[HEAD_INDICES] = (-pitch, yaw, roll)
+        return values
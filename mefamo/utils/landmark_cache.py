@@ -0,0 +1,92 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+NUM_LANDMARKS = 478
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """ Returns the blake2b hash of the content of the file. """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class LandmarkCache():
+    """ LandmarkCache class
+
+    On-disk cache of the mediapipe landmarks of every frame of a video, so
+    repeated runs on the same video (e.g. while tuning the BlendShapeConfig)
+    don't need to run the face mesh inference again.
+
+    The cache is keyed by the content hash of the video, the FaceMesh
+    settings and the inference width (if the frames get scaled down for the
+    FaceMesh, the landmarks differ a bit). The landmarks of all frames are stored in a memory mapped array
+    (frames x faces x 478 x 3) and an index stores the number of faces of every
+    frame (-1 for frames that aren't cached yet).
+    """
+
+    def __init__(self, cache_dir: str, video_path: str, face_mesh_settings: dict, frame_count: int, inference_width: int = None) -> None:
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_faces = face_mesh_settings.get('max_num_faces', 1)
+        # without refine_landmarks, mediapipe doesn't return the iris landmarks
+        self.num_landmarks = NUM_LANDMARKS if face_mesh_settings.get('refine_landmarks', False) else 468
+        self.frame_count = max(int(frame_count), 1)
+        # a copy, the settings of the Mefamo change with the tiers of the quality governor
+        self.face_mesh_settings = dict(face_mesh_settings)
+        self.inference_width = inference_width or None
+
+        key = hashlib.blake2b(digest_size=16)
+        key.update(hash_file(video_path).encode())
+        key.update(json.dumps(face_mesh_settings, sort_keys=True).encode())
+        if inference_width:
+            # the caches of the full size frames keep their key
+            key.update(f'inference_width={int(inference_width)}'.encode())
+        self.key = key.hexdigest()
+
+        self.landmarks_path = os.path.join(cache_dir, f'{self.key}.landmarks.npy')
+        self.index_path = os.path.join(cache_dir, f'{self.key}.index.npy')
+
+        shape = (self.frame_count, self.max_faces, NUM_LANDMARKS, 3)
+        if os.path.exists(self.landmarks_path) and os.path.exists(self.index_path):
+            self.landmarks = np.lib.format.open_memmap(self.landmarks_path, mode='r+')
+            self.index = np.lib.format.open_memmap(self.index_path, mode='r+')
+            if self.landmarks.shape != shape or self.index.shape != (self.frame_count,):
+                raise ValueError(f'The landmark cache {self.landmarks_path} doesn\'t match the video, delete it.')
+        else:
+            self.landmarks = np.lib.format.open_memmap(self.landmarks_path, mode='w+', dtype=np.float32, shape=shape)
+            self.index = np.lib.format.open_memmap(self.index_path, mode='w+', dtype=np.int8, shape=(self.frame_count,))
+            self.index[:] = -1
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, frame_index: int):
+        """ Returns the cached landmarks of the frame as a list of 478 x 3 arrays (one per face), or None if the frame isn't cached. """
+        if frame_index >= self.frame_count or self.index[frame_index] < 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [self.landmarks[frame_index, face, :self.num_landmarks] for face in range(self.index[frame_index])]
+
+    def matches(self, face_mesh_settings: dict, inference_width: int = None) -> bool:
+        """ True if landmarks of the FaceMesh with these settings (and inference width) belong into this cache. """
+        return face_mesh_settings == self.face_mesh_settings and (inference_width or None) == self.inference_width
+
+    def put(self, frame_index: int, faces) -> None:
+        """ Stores the landmarks of the frame, faces is a list of N x 3 arrays (one per face). """
+        if frame_index >= self.frame_count:
+            return
+        faces = faces[:self.max_faces]
+        for i, landmarks in enumerate(faces):
+            count = min(len(landmarks), NUM_LANDMARKS)
+            self.landmarks[frame_index, i, :count] = landmarks[:count]
+        self.index[frame_index] = len(faces)
+
+    def close(self) -> None:
+        # the landmarks are written before the index, so the index never points to missing data
+        self.landmarks.flush()
+        self.index.flush()
@@ -0,0 +1,90 @@
+import cv2
+import numpy as np
+
+
+class MotionGate():
+    """ MotionGate class
+
+    Cheap change detector, which decides if the FaceMesh needs to run on a
+    frame. The region of the last known faces is converted to gray and scaled
+    down to size x size cells, which averages out most of the sensor noise, and
+    compared to the same region of the frame of the last inference. If no cell
+    changed by more than the threshold, the previous landmarks are still valid.
+    The largest change of a cell is used instead of the mean, so small local
+    movements like a blink aren't averaged away by the rest of the face.
+    Comparing with the frame of the last inference (instead of the last
+    frame) makes sure slow movements add up until they are detected.
+
+    Without a known face every frame needs the inference. The FaceMesh also
+    refines its landmarks over a few frames after a face was found or moved,
+    so frames are only skipped once the landmarks moved less than
+    landmark_tolerance in settle_count inferences in a row. After max_skip skipped frames the
+    inference runs anyway.
+    """
+
+    def __init__(self, threshold: float = 4.0, size: int = 32, margin: float = 0.1, max_skip: int = 30,
+                 landmark_tolerance: float = 0.001, settle_count: int = 5) -> None:
+        # largest absolute difference of the gray value (0 - 255) of a cell
+        self.threshold = threshold
+        self.size = size
+        # the face box gets extended by this part of its size on every side
+        self.margin = margin
+        self.max_skip = max_skip
+        # mean absolute change of the normalized landmarks
+        self.landmark_tolerance = landmark_tolerance
+        # number of inferences in a row within the tolerance before frames get skipped
+        self.settle_count = settle_count
+
+        self.landmarks = None
+        self.settled = 0
+        self.box = None
+        self.reference = None
+        self.skipped = 0
+        self.difference = 0.0
+        self._small = np.empty((size, size), dtype=np.uint8)
+
+    def _crop(self, image, box):
+        x0, y0, x1, y1 = box
+        gray = cv2.cvtColor(image[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        return cv2.resize(gray, (self.size, self.size), dst=self._small, interpolation=cv2.INTER_AREA)
+
+    def changed(self, image: np.ndarray) -> bool:
+        """ Returns True if the FaceMesh has to run on the frame (BGR image). """
+        if self.box is None or self.settled < self.settle_count or self.skipped >= self.max_skip:
+            return True
+
+        small = self._crop(image, self.box)
+        self.difference = float(cv2.norm(small, self.reference, cv2.NORM_INF))
+        if self.difference > self.threshold:
+            return True
+        self.skipped += 1
+        return False
+
+    def update(self, image: np.ndarray, landmarks) -> None:
+        """ Stores the region of the faces after an inference, landmarks is a faces x N x 3 array of normalized landmarks (or None). """
+        self.skipped = 0
+        if landmarks is None or len(landmarks) == 0:
+            self.box = None
+            self.reference = None
+            self.landmarks = None
+            self.settled = 0
+            return
+
+        if (self.landmarks is not None and self.landmarks.shape == landmarks.shape
+                and float(np.mean(np.abs(landmarks[:, :, :2] - self.landmarks[:, :, :2]))) < self.landmark_tolerance):
+            self.settled += 1
+        else:
+            self.settled = 0
+        self.landmarks = landmarks.copy()
+
+        height, width = image.shape[:2]
+        x_min, y_min = landmarks[:, :, 0].min(), landmarks[:, :, 1].min()
+        x_max, y_max = landmarks[:, :, 0].max(), landmarks[:, :, 1].max()
+        margin_x = (x_max - x_min) * self.margin
+        margin_y = (y_max - y_min) * self.margin
+        x0 = int(np.clip((x_min - margin_x) * width, 0, width - 1))
+        y0 = int(np.clip((y_min - margin_y) * height, 0, height - 1))
+        x1 = int(np.clip((x_max + margin_x) * width, x0 + 1, width))
+        y1 = int(np.clip((y_max + margin_y) * height, y0 + 1, height))
+        self.box = (x0, y0, x1, y1)
+        self.reference = self._crop(image, self.box).copy()
@@ -0,0 +1,109 @@
+import numpy as np
+
+# every tier lowers the quality of the tier before it a bit further, the values are
+# limits for the settings the user chose (e.g. the 3d preview is never turned on)
+QUALITY_TIERS = [
+    ('full', {}),
+    ('no_3d_preview', {'show_3d': False}),
+    ('no_debug_text', {'show_debug': False}),
+    ('inference_640', {'inference_width': 640}),
+    ('no_overlay', {'draw_mesh': False}),
+    ('inference_480', {'inference_width': 480}),
+    ('no_refine', {'refine_landmarks': False}),
+    ('inference_320', {'inference_width': 320}),
+]
+
+
+def tier_settings(requested: dict, tiers: list = QUALITY_TIERS, frame_width: int = None) -> list:
+    """ Returns (name, settings) of every tier, applied to the requested settings.
+
+    Boolean settings can only be turned off and the inference width can only
+    get smaller. With the frame_width, an inference width that doesn't scale
+    the frames down is None (the frames aren't scaled). Tiers that don't change
+    anything for the requested settings are left out, so every step of the
+    governor makes a difference.
+    """
+    result = []
+    settings = dict(requested)
+    for name, limits in tiers:
+        for key, value in limits.items():
+            if key == 'inference_width':
+                settings[key] = value if not settings.get(key) else min(settings[key], value)
+            else:
+                settings[key] = settings.get(key, True) and value
+        if frame_width and settings.get('inference_width') and settings['inference_width'] >= frame_width:
+            settings['inference_width'] = None
+        if not result or result[-1][1] != settings:
+            result.append((name, dict(settings)))
+    return result
+
+
+class QualityGovernor():
+    """ QualityGovernor class
+
+    Keeps the processing time of the frames within a budget (in seconds), by
+    stepping through a number of quality tiers (0 is the best quality). The
+    90th percentile of the last window frame times is compared to the budget:
+    above it the quality goes one tier down, below headroom * budget it goes
+    one tier up again. After every change a whole window of frames at the new
+    tier is measured before the next change.
+
+    Going up needs recover_frames frames with enough headroom. If the tier
+    above turns out to be too slow again right away, the time to recover is
+    doubled, so a machine at the edge of the budget doesn't keep switching.
+    """
+
+    def __init__(self, num_tiers: int, budget: float = 1 / 30, window: int = 30, headroom: float = 0.7,
+                 recover_frames: int = 300, max_recover_frames: int = 4800) -> None:
+        self.num_tiers = num_tiers
+        self.budget = budget
+        self.window = window
+        self.headroom = headroom
+        self.recover_frames = recover_frames
+        self.max_recover_frames = max_recover_frames
+
+        self.tier = 0
+        # 90th percentile of the frame times that caused the last change
+        self.load = 0.0
+        self.changes = 0
+        self._times = np.zeros(window)
+        self._count = 0
+        self._good_frames = 0
+        self._stepped_up = False
+
+    def update(self, frame_time: float) -> bool:
+        """ Adds the processing time of a frame (in seconds), returns True if the tier changed. """
+        self._times[self._count % self.window] = frame_time
+        self._count += 1
+        if self._count < self.window:
+            return False
+
+        load = float(np.percentile(self._times, 90))
+        if load > self.budget:
+            self._good_frames = 0
+            if self.tier >= self.num_tiers - 1:
+                return False
+            if self._stepped_up:
+                # the tier above was already too slow
+                self.recover_frames = min(self.recover_frames * 2, self.max_recover_frames)
+            self._change(self.tier + 1, load)
+            self._stepped_up = False
+            return True
+
+        self._stepped_up = False
+        if load < self.budget * self.headroom and self.tier > 0:
+            self._good_frames += 1
+            if self._good_frames >= self.recover_frames:
+                self._change(self.tier - 1, load)
+                self._stepped_up = True
+                return True
+        else:
+            self._good_frames = 0
+        return False
+
+    def _change(self, tier, load):
+        self.tier = tier
+        self.load = load
+        self.changes += 1
+        self._count = 0
+        self._good_frames = 0
@@ -0,0 +1,188 @@
+from types import SimpleNamespace
+import cv2
+import numpy as np
+
+from mefamo.custom.face_geometry import PCF, canonical_metric_landmarks
+from mefamo.blendshapes.blendshape_config import BlendShapeConfig
+
+# mediapipe returns 468 face landmarks + 10 iris landmarks (with refine_landmarks=True)
+NUM_LANDMARKS = 478
+
+
+def rotation_matrix(pitch: float, yaw: float, roll: float) -> np.ndarray:
+    """ Rotation matrix from rotations (in radians) around the x, y and z axis. """
+    cx, sx = np.cos(pitch), np.sin(pitch)
+    cy, sy = np.cos(yaw), np.sin(yaw)
+    cz, sz = np.cos(roll), np.sin(roll)
+    rx = np.array([[1, 0, 0], [0, cx, -sx], [0, sx, cx]])
+    ry = np.array([[cy, 0, sy], [0, 1, 0], [-sy, 0, cy]])
+    rz = np.array([[cz, -sz, 0], [sz, cz, 0], [0, 0, 1]])
+    return rz @ ry @ rx
+
+
+def _iris_points(points):
+    # the iris center and four points around it, 0.5cm apart
+    center = points.mean(axis=1)
+    offsets = np.array([[0, 0, 0], [0.5, 0, 0], [0, 0.5, 0], [-0.5, 0, 0], [0, -0.5, 0]]).T
+    return center[:, None] + offsets
+
+
+# canonical face model with iris points, 3 x 478 in cm
+canonical_landmarks_with_iris = np.concatenate([
+    canonical_metric_landmarks,
+    _iris_points(canonical_metric_landmarks[:, BlendShapeConfig.CanonicalPpoints.eye_right]),
+    _iris_points(canonical_metric_landmarks[:, BlendShapeConfig.CanonicalPpoints.eye_left]),
+], axis=1)
+
+
+def project_landmarks(metric_points: np.ndarray, pcf: PCF) -> np.ndarray:
+    """ Projects 3 x N camera space points (in cm, camera looking down -z) into normalized
+    mediapipe landmarks (N x 3, x and y in 0 - 1, z relative depth scaled like x). """
+    x, y, z = metric_points
+    depth = -z
+    focal = pcf.fy
+    x_px = pcf.frame_width / 2 + focal * x / depth
+    y_px = pcf.frame_height / 2 - focal * y / depth
+
+    mean_depth = depth.mean()
+    z_px = (depth - mean_depth) * focal / mean_depth
+    return np.stack([x_px / pcf.frame_width, y_px / pcf.frame_height, z_px / pcf.frame_width], axis=1)
+
+
+def random_landmarks(rng: np.random.Generator, pcf: PCF, noise: float = 0.001,
+                     max_angle: float = 0.5, distance: tuple = (40.0, 80.0), scale: tuple = (0.9, 1.1)) -> np.ndarray:
+    """ Creates normalized landmarks (478 x 3) of the canonical face with a random rotation, translation, scale and noise.
+
+    Parameters
+    ----------
+    rng : np.random.Generator
+        Random generator, use a seeded one for reproducible fixtures.
+    pcf: PCF
+        The pseudo camera used for the projection.
+    noise: float
+        Standard deviation of the gaussian noise added to the normalized coordinates.
+    max_angle: float
+        Maximum rotation around every axis in radians.
+    distance: tuple
+        Range of the distance of the face to the camera in cm.
+    scale: tuple
+        Range of the scale of the face.
+
+    Returns
+    ----------
+    np.ndarray
+        The landmarks like mediapipe would return them, as a 478 x 3 numpy array.
+    """
+
+    rotation = rotation_matrix(*rng.uniform(-max_angle, max_angle, 3))
+    depth = rng.uniform(*distance)
+    # keep the face inside of the image
+    translation = np.array([rng.uniform(-0.15, 0.15) * depth, rng.uniform(-0.1, 0.1) * depth, -depth])
+    points = rng.uniform(*scale) * rotation @ canonical_landmarks_with_iris + translation[:, None]
+
+    landmarks = project_landmarks(points, pcf)
+    landmarks += rng.normal(0, noise, landmarks.shape)
+    return landmarks
+
+
+def to_landmark_list(landmarks: np.ndarray):
+    """ Wraps a N x 3 landmark array into an object that looks like mediapipe's NormalizedLandmarkList. """
+    return SimpleNamespace(landmark=[SimpleNamespace(x=x, y=y, z=z) for x, y, z in landmarks.tolist()])
+
+
+def _canonical_triangles():
+    # delaunay triangulation of the frontal canonical face, the face is close to a height field from the front
+    points = canonical_metric_landmarks[:2].T
+    subdiv = cv2.Subdiv2D((-20, -20, 40, 40))
+    for x, y in points:
+        subdiv.insert((float(x), float(y)))
+    triangles = []
+    for triangle in subdiv.getTriangleList().reshape(-1, 3, 2):
+        if np.abs(triangle).max() > 15:
+            # triangle connected to the outer corners of the subdivision
+            continue
+        distances = np.linalg.norm(points[None, :, :] - triangle[:, None, :], axis=2)
+        triangles.append(np.argmin(distances, axis=1))
+    return np.array(triangles)
+
+
+# per landmark colors (BGR) of the rendered face
+_SKIN_COLOR = (120, 150, 200)
+_LIP_COLOR = (90, 90, 170)
+_EYE_COLOR = (40, 40, 40)
+_LIP_POINTS = [0, 13, 14, 17, 37, 39, 40, 61, 78, 80, 81, 82, 84, 87, 88, 91, 95, 146, 178, 181, 185, 191, 267, 269, 270,
+               291, 308, 310, 311, 312, 314, 317, 318, 321, 324, 375, 402, 405, 409, 415]
+_EYE_POINTS = [7, 33, 133, 144, 145, 153, 154, 155, 157, 158, 159, 160, 161, 163, 173, 246,
+               249, 263, 362, 373, 374, 380, 381, 382, 384, 385, 386, 387, 388, 390, 398, 466]
+
+
+class FaceRenderer():
+    """ FaceRenderer class
+
+    Renders the canonical face model as a flat shaded mesh, with scripted
+    expressions and head movements. It's used to create synthetic videos for
+    the benchmarks and warm up frames, so no camera is needed.
+    """
+
+    def __init__(self, width: int = 640, height: int = 480) -> None:
+        self.width = width
+        self.height = height
+        self.pcf = PCF(frame_height=height, frame_width=width, fy=width)
+        self.triangles = _canonical_triangles()
+
+        colors = np.tile(np.array(_SKIN_COLOR, dtype=np.float64), (canonical_metric_landmarks.shape[1], 1))
+        colors[_LIP_POINTS] = _LIP_COLOR
+        colors[_EYE_POINTS] = _EYE_COLOR
+        self.triangle_colors = colors[self.triangles].mean(axis=1)
+
+    @staticmethod
+    def expression(jaw_open: float = 0.0, blink: float = 0.0, smile: float = 0.0) -> np.ndarray:
+        """ Returns the canonical face model (3 x 468) deformed by the given expression values (0 - 1). """
+        points = canonical_metric_landmarks.copy()
+        y = points[1]
+
+        # jaw: everything below the mouth moves down
+        mouth_y = points[1, BlendShapeConfig.CanonicalPpoints.upper_lip]
+        below_mouth = np.clip((mouth_y - y) / 3.0, 0, 1)
+        points[1] -= jaw_open * 1.5 * below_mouth
+
+        # smile: the mouth corners move up and out
+        for corner in (BlendShapeConfig.CanonicalPpoints.mouth_corner_left, BlendShapeConfig.CanonicalPpoints.mouth_corner_right):
+            weight = np.exp(-np.sum((points[:2] - points[:2, corner:corner + 1]) ** 2, axis=0) / 1.5)
+            points[0] += smile * 0.4 * np.sign(points[0, corner]) * weight
+            points[1] += smile * 0.5 * weight
+
+        # blink: the upper eye lids move to the lower ones
+        for eye in (BlendShapeConfig.CanonicalPpoints.eye_left, BlendShapeConfig.CanonicalPpoints.eye_right):
+            for upper, lower in zip(eye[2:5], eye[5:8]):
+                points[1, upper] += blink * (points[1, lower] - points[1, upper])
+        return points
+
+    def landmarks(self, points: np.ndarray, pitch: float = 0.0, yaw: float = 0.0, roll: float = 0.0,
+                  translation = (0.0, 0.0, -50.0)) -> np.ndarray:
+        """ Rotates and moves the face points (3 x N) and projects them into normalized landmarks (N x 3). """
+        camera_points = rotation_matrix(pitch, yaw, roll) @ points + np.asarray(translation)[:, None]
+        return project_landmarks(camera_points, self.pcf)
+
+    def render(self, landmarks: np.ndarray, image: np.ndarray = None) -> np.ndarray:
+        """ Renders the normalized landmarks (468 x 3) as a shaded mesh into the image (a new gray image if None). """
+        if image is None:
+            image = np.full((self.height, self.width, 3), 60, dtype=np.uint8)
+
+        pixels = landmarks[:, :2] * (self.width, self.height)
+        # draw far triangles first
+        depth = landmarks[self.triangles, 2].mean(axis=1)
+        order = np.argsort(-depth)
+
+        # flat shading with a light from the camera
+        corners = landmarks[self.triangles] * (self.width, self.height, self.width)
+        normals = np.cross(corners[:, 1] - corners[:, 0], corners[:, 2] - corners[:, 0])
+        lengths = np.linalg.norm(normals, axis=1)
+        lengths[lengths == 0] = 1
+        shading = 0.35 + 0.65 * np.abs(normals[:, 2]) / lengths
+        colors = self.triangle_colors * shading[:, None]
+
+        polygons = np.round(pixels[self.triangles] * 16).astype(np.int32)
+        for i in order:
+            cv2.fillConvexPoly(image, polygons[i], colors[i].tolist(), cv2.LINE_AA, 4)
+        return image
@@ -0,0 +1,114 @@
+import json
+import threading
+import time
+import numpy as np
+
+
+class _Stage():
+    # context manager that measures the time of one stage, reused for every frame
+    __slots__ = ('timer', 'name', 'start')
+
+    def __init__(self, timer, name) -> None:
+        self.timer = timer
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.timer.record(self.name, time.perf_counter() - self.start, self.start)
+        return False
+
+
+class _NullStage():
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class StageTimer():
+    """ StageTimer class
+
+    Records how long every stage of the frame pipeline takes. The durations of
+    each stage are kept in a fixed-size ring buffer, so the percentiles are
+    always calculated over the last `capacity` frames and the memory stays
+    constant during long sessions.
+
+    If a tracer (see TraceWriter) is set, every stage is also added to it as a
+    span, tagged with the current frame number.
+
+    Every stage should only be recorded once per frame (stages of a single
+    face, like the blendshapes, once per face), code that runs several times
+    in a frame gets a stage name per call site. Stages can be recorded from
+    several threads (the display thread records its own stage), recording and
+    reading the percentiles share a lock.
+    """
+
+    def __init__(self, capacity: int = 512, enabled: bool = True, tracer = None) -> None:
+        self.capacity = capacity
+        self.enabled = enabled
+        self.tracer = tracer
+        self.frame = 0
+        self._durations = {}
+        self._counts = {}
+        self._stages = {}
+        self._lock = threading.Lock()
+
+    def stage(self, name: str):
+        """ Returns a context manager that records the duration of the enclosed code as the given stage. """
+        if not self.enabled:
+            return _NULL_STAGE
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = _Stage(self, name)
+        return stage
+
+    def record(self, name: str, duration: float, start: float = None) -> None:
+        """ Records the duration (in seconds) of a stage, start is needed for the tracer (time.perf_counter() seconds). """
+        if not self.enabled:
+            return
+        if self.tracer is not None and start is not None:
+            self.tracer.add_span(name, start, duration, self.frame)
+        with self._lock:
+            durations = self._durations.get(name)
+            if durations is None:
+                durations = self._durations[name] = np.zeros(self.capacity)
+                self._counts[name] = 0
+            count = self._counts[name]
+            durations[count % self.capacity] = duration
+            self._counts[name] = count + 1
+
+    def percentiles(self, percentiles = (50, 90, 99)) -> dict:
+        """ Returns the percentiles of every stage in milliseconds, together with the number of recorded frames. """
+        # copy under the lock, the percentiles are calculated without blocking the recording threads
+        with self._lock:
+            recorded = [(name, durations[:min(self._counts[name], self.capacity)] * 1000.0, self._counts[name])
+                        for name, durations in self._durations.items()]
+        stats = {}
+        for name, values, count in recorded:
+            stats[name] = {f'p{p}': float(np.percentile(values, p)) for p in percentiles}
+            stats[name]['count'] = count
+        return stats
+
+    def summary_lines(self) -> list:
+        """ Returns one human readable line per stage. """
+        return [f'{name}: {s["p50"]:.1f} / {s["p90"]:.1f} / {s["p99"]:.1f} ms'
+                for name, s in self.percentiles().items()]
+
+    def dump_json(self, path: str) -> None:
+        """ Writes the percentiles of all stages as json to the given path. """
+        with open(path, 'w') as f:
+            json.dump(self.percentiles(), f, indent=4)
+
+
+# used when no timing is wanted
+NULL_TIMER = StageTimer(capacity=1, enabled=False)
@@ -0,0 +1,77 @@
+import json
+import os
+import threading
+from collections import deque
+
+
+class TraceWriter():
+    """ TraceWriter class
+
+    Writes spans in the Chrome trace-event format (JSON array format), which
+    can be opened in chrome://tracing or https://ui.perfetto.dev.
+
+    Adding a span only appends a tuple to an in-memory queue, the formatting and
+    writing is done by a background thread every `flush_interval` seconds, so
+    tracing long sessions has almost no overhead on the traced threads.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 1.0) -> None:
+        self.path = path
+        self.flush_interval = flush_interval
+        self.pid = os.getpid()
+        self._events = deque()
+        self._thread_names = {}
+        self._file = open(path, 'w')
+        self._file.write('[\n')
+        self._closed = threading.Event()
+        self._flush_thread = threading.Thread(target=self._flush_loop, daemon=True)
+        self._flush_thread.start()
+
+    def add_span(self, name: str, start: float, duration: float, frame: int = None) -> None:
+        """ Adds a span of the current thread, start and duration are time.perf_counter() seconds. """
+        # after close nothing writes the spans any more, they would only pile up
+        if self._closed.is_set():
+            return
+        thread = threading.current_thread()
+        if thread.ident not in self._thread_names:
+            self._thread_names[thread.ident] = thread.name
+        # deque.append is thread safe, no lock needed
+        self._events.append((name, start, duration, thread.ident, frame))
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self) -> None:
+        """ Writes all buffered spans to the file. """
+        lines = []
+        while self._events:
+            name, start, duration, tid, frame = self._events.popleft()
+            event = {
+                'name': name,
+                'ph': 'X',
+                'ts': start * 1e6,
+                'dur': duration * 1e6,
+                'pid': self.pid,
+                'tid': tid,
+            }
+            if frame is not None:
+                event['args'] = {'frame': frame}
+            lines.append(json.dumps(event))
+        if not lines:
+            return
+        self._file.write(',\n'.join(lines) + ',\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        """ Writes the remaining spans and the thread names and closes the file. """
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._flush_thread.join()
+        self.flush()
+        metadata = [json.dumps({'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': tid, 'args': {'name': name}})
+                    for tid, name in list(self._thread_names.items())]
+        metadata.append(json.dumps({'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'MeFaMo'}}))
+        self._file.write(',\n'.join(metadata) + '\n]\n')
+        self._file.close()
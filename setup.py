@@ -13,9 +13,11 @@ setup(
         'numpy',
         'opencv-python',
         'pylivelinkface',
-        'mediapipe',
-        'transforms3d',
-        'open3d'
-    ]
+        'mediapipe'
+    ],
+    extras_require={
+        # only needed for --show_3d
+        '3d': ['open3d']
+    }
 )
 